@@ -29,6 +29,11 @@ def pytest_addoption(parser):
     parser.addoption('--cpu-quota', action='store', default=0.0,
                      type=float, help='CPU quota to set. 0.0 to set no'
                                       ' quota.')
+    parser.addoption('--quota-target', action='store', default=0.9,
+                     type=float, help='With a CPU quota, hold new masters '
+                                      'and builds while the agent role uses '
+                                      'more than this fraction of it '
+                                      '(default: 0.9).')
     parser.addoption('--work-duration', action='store', default=600,
                      type=int, help='Duration, in seconds, for the '
                                     'workload to last (sleep).')
@@ -37,7 +42,9 @@ def pytest_addoption(parser):
     parser.addoption('--external-volume', action='store_true',
                      help='Use rexray external volumes.')
     parser.addoption('--scenario', action='store', default='sleep',
-                     help='Test scenario to run (sleep, buildmarathon) '
+                     help='Test scenario to run, or a weighted mix such as '
+                          'sleep:3,cpu:1 (sleep, buildmarathon, cpu, io, '
+                          'docker-build, pipeline, artifact) '
                           '(default: sleep).')
     parser.addoption('--min', action='store', default=-1,
                      help='min jenkins index to start from'
@@ -48,6 +55,38 @@ def pytest_addoption(parser):
     parser.addoption('--batch-size', action='store', default=1,
                      help='batch size to deploy jenkins masters in'
                           '(default: 1).')
+    parser.addoption('--warm-pool', action='store', default=1, type=int,
+                     help='Idle agents to keep for the warm agent label '
+                          '(default: 1).')
+    parser.addoption('--cron-style', action='store', default='fixed',
+                     help='Schedule generated jobs at the same minute '
+                          '(fixed, */X) or spread by job name (hashed, H/X) '
+                          '(default: fixed).')
+    parser.addoption('--jitter', action='store', default=0, type=int,
+                     help='Delay generated jobs by a random quiet period of '
+                          'up to this many seconds (default: 0).')
+    parser.addoption('--record-launches', action='store_true',
+                     help='Wait for a scheduled run of every job and record '
+                          'when they launched.')
+    parser.addoption('--group-deploy', action='store_true',
+                     help='Deploy each batch of masters as one Marathon '
+                          'deployment.')
+    parser.addoption('--pin-masters', action='store_true',
+                     help='Pin each master to the agent the planner '
+                          'placed it on.')
+    parser.addoption('--fit-masters', action='store_true',
+                     help='Only launch as many masters as the planner '
+                          'found room for.')
+    parser.addoption('--arrival-model', action='store', default='poisson',
+                     help='Build arrival model for the load generator '
+                          '(poisson, burst, diurnal) (default: poisson).')
+    parser.addoption('--arrival-rate', action='store', default=10.0,
+                     type=float, help='Builds per minute the load generator '
+                                      'triggers across all masters '
+                                      '(default: 10.0).')
+    parser.addoption('--load-duration', action='store', default=600,
+                     type=int, help='Duration, in seconds, to generate '
+                                    'load for (default: 600).')
 
 
 @pytest.fixture
@@ -75,6 +114,11 @@ def cpu_quota(request) -> float:
     return float(request.config.getoption('--cpu-quota'))
 
 
+@pytest.fixture
+def quota_target(request) -> float:
+    return float(request.config.getoption('--quota-target'))
+
+
 @pytest.fixture
 def work_duration(request) -> int:
     return int(request.config.getoption('--work-duration'))
@@ -94,14 +138,67 @@ def scenario(request) -> str:
 def external_volume(request) -> bool:
     return bool(request.config.getoption('--external-volume'))
 
+
 @pytest.fixture
 def min_index(request) -> int:
     return int(request.config.getoption('--min'))
 
+
 @pytest.fixture
 def max_index(request) -> int:
     return int(request.config.getoption('--max'))
 
+
 @pytest.fixture
 def batch_size(request) -> int:
     return int(request.config.getoption('--batch-size'))
+
+
+@pytest.fixture
+def warm_pool(request) -> int:
+    return int(request.config.getoption('--warm-pool'))
+
+
+@pytest.fixture
+def arrival_model(request) -> str:
+    return request.config.getoption('--arrival-model')
+
+
+@pytest.fixture
+def arrival_rate(request) -> float:
+    return float(request.config.getoption('--arrival-rate'))
+
+
+@pytest.fixture
+def load_duration(request) -> int:
+    return int(request.config.getoption('--load-duration'))
+
+
+@pytest.fixture
+def cron_style(request) -> str:
+    return request.config.getoption('--cron-style')
+
+
+@pytest.fixture
+def jitter(request) -> int:
+    return int(request.config.getoption('--jitter'))
+
+
+@pytest.fixture
+def record_launches(request) -> bool:
+    return bool(request.config.getoption('--record-launches'))
+
+
+@pytest.fixture
+def group_deploy(request) -> bool:
+    return bool(request.config.getoption('--group-deploy'))
+
+
+@pytest.fixture
+def pin_masters(request) -> bool:
+    return bool(request.config.getoption('--pin-masters'))
+
+
+@pytest.fixture
+def fit_masters(request) -> bool:
+    return bool(request.config.getoption('--fit-masters'))
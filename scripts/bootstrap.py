@@ -1,15 +1,62 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 """
 Reconfigures a Jenkins master running in Docker at container runtime.
-"""
 
-from __future__ import print_function
+This runs on every master start before nginx and Jenkins are launched, so
+only the modules needed by every code path are imported at module level;
+everything else is imported where it is used.
+
+Usage:
+    bootstrap.py [configure]    rewrite the Jenkins and nginx configuration
+    bootstrap.py known-hosts    populate the SSH known hosts file
+    bootstrap.py prepare-image  pre-expand the WAR and plugins (image build)
+    bootstrap.py startup-report write and emit the startup phase timings
+"""
 
 import os
-import re
-import subprocess
 import sys
-import xml.etree.ElementTree as ET
+import time
+
+JENKINS_FOLDER = os.getenv('JENKINS_FOLDER', '/usr/share/jenkins')
+JENKINS_STAGING = os.getenv('JENKINS_STAGING', '/usr/share/jenkins/ref/')
+# Reference plugins, moved out of JENKINS_STAGING and expanded at image build
+# time. The base image's jenkins.sh copies every file under JENKINS_STAGING
+# one by one on each start, which the expanded plugins would multiply.
+JENKINS_PLUGIN_STAGING = os.getenv('JENKINS_PLUGIN_STAGING', os.path.join(JENKINS_FOLDER, 'ref-plugins'))
+# Checksums of the reference plugins, written at image build time
+PLUGIN_CHECKSUMS = '.checksums.json'
+# Checksums of the reference plugins last copied into JENKINS_HOME
+SYNCED_PLUGIN_CHECKSUMS = '.ref-checksums.json'
+# Mesos cloud settings last applied to config.xml, in JENKINS_HOME
+APPLIED_CLOUD_SETTINGS = '.mesos-cloud-settings.json'
+# Key of the default agent's warm pool (min, max) in APPLIED_CLOUD_SETTINGS
+APPLIED_WARM_POOL = 'warmPool'
+# Environment variables for Mesos cloud settings and the config.xml element,
+# relative to the MesosCloud element, that each one sets
+DEFAULT_SLAVE_INFO = './slaveInfos/org.jenkinsci.plugins.mesos.MesosSlaveInfo[1]'
+MESOS_CLOUD_SETTINGS = (
+    ('JENKINS_ON_DEMAND_REGISTRATION', './onDemandRegistration'),
+    ('JENKINS_AGENT_CPUS', DEFAULT_SLAVE_INFO + '/slaveCpus'),
+    ('JENKINS_AGENT_MEM', DEFAULT_SLAVE_INFO + '/slaveMem'),
+    ('JENKINS_AGENT_EXECUTOR_CPUS', DEFAULT_SLAVE_INFO + '/executorCpus'),
+    ('JENKINS_AGENT_EXECUTOR_MEM', DEFAULT_SLAVE_INFO + '/executorMem'),
+    ('JENKINS_AGENT_MAX_EXECUTORS', DEFAULT_SLAVE_INFO + '/maxExecutors'),
+    ('JENKINS_AGENT_IDLE_TERMINATION_MINUTES', DEFAULT_SLAVE_INFO + '/idleTerminationMinutes'),
+    ('JENKINS_AGENT_DOCKER_FORCE_PULL', DEFAULT_SLAVE_INFO + '/containerInfo/dockerForcePullImage'),
+)
+# Prefix of the startup phase metrics sent to statsd
+STARTUP_METRIC_PREFIX = 'jenkinsstatsd.startup'
+NGINX_TEMPLATE = '/usr/local/jenkins/conf/nginx.conf.template'
+NGINX_CONFIG = '/var/nginx/nginx.conf'
+
+# Warn when the configure step takes longer than this many seconds.
+DEFAULT_BUDGET_SECONDS = 1.0
+# Per-host timeout, in seconds, passed to ssh-keyscan.
+DEFAULT_KEYSCAN_TIMEOUT = 5
+# Hard limit, in seconds, on scanning all SSH known hosts.
+DEFAULT_KEYSCAN_DEADLINE = 15
+# How long, in seconds, cached SSH host keys are reused before a rescan.
+DEFAULT_KNOWN_HOSTS_CACHE_TTL = 24 * 60 * 60
 
 
 def mesos_dns_taskname(jenkins_service_name, marathon_name, nginx_port):
@@ -20,11 +67,13 @@ def mesos_dns_taskname(jenkins_service_name, marathon_name, nginx_port):
     return marathon_dns_url.format(service_name, marathon_name, nginx_port)
 
 
-def populate_jenkins_config_xml(config_xml, master, name, port, role, user, marathon_name):
+def populate_jenkins_config_xml(config_xml, master, name, port, role, user, marathon_name, cloud_settings=None,
+                                warm_pool=None):
     """Modifies a Jenkins master's 'config.xml' at runtime. Essentially, this
     replaces certain configuration options of the Mesos plugin, such as the
     framework name and the Jenkins URL that agents use to connect back to the
-    master.
+    master, along with any provisioning settings in `cloud_settings` and the
+    default agent's warm pool size.
 
     :param config_xml: the path to Jenkins' 'config.xml' file
     :param name: the name of the framework, e.g. 'jenkins'
@@ -32,6 +81,10 @@ def populate_jenkins_config_xml(config_xml, master, name, port, role, user, mara
     :param role: The role passed to the internal Jenkins configuration that denotes which resources can be launched
     :param user: the user the task is running on
     :param marathon_name: the name of the Marathon framework the Jenkins master is deployed from. Change when using a MoM.
+    :param cloud_settings: a dict of element paths, relative to the MesosCloud element, to their new text,
+                           as returned by mesos_cloud_settings()
+    :param warm_pool: a (min, max) tuple of idle agents to keep for the default agent label, see
+                      'init.groovy.d/mesos-warm-pool.groovy'; None leaves it unchanged
     """
     tree, root = _get_xml_root(config_xml)
     mesos = root.find('./clouds/org.jenkinsci.plugins.mesos.MesosCloud')
@@ -42,10 +95,51 @@ def populate_jenkins_config_xml(config_xml, master, name, port, role, user, mara
     _find_and_set(mesos, './jenkinsURL', mesos_dns_taskname(name, marathon_name, port))
     _find_and_set(mesos, './role', role)
     _find_and_set(mesos, './slavesUser', user)
+    for term, value in sorted((cloud_settings or {}).items()):
+        element = mesos.find(term)
+        if element is None:
+            print("WARNING: no {} in the Mesos cloud of {}, not setting it.".format(term, config_xml))
+            continue
+        element.text = value
+    if warm_pool is not None:
+        slave_info = mesos.find(DEFAULT_SLAVE_INFO)
+        if slave_info is None:
+            print("WARNING: no default agent in the Mesos cloud of {}, not setting its warm pool.".format(config_xml))
+        else:
+            _set_warm_pool(slave_info, *warm_pool)
 
     tree.write(config_xml)
 
 
+def mesos_cloud_settings(environ):
+    """Returns the Mesos cloud provisioning settings given in the environment.
+    Agent settings apply to the default (first) MesosSlaveInfo. Settings whose
+    variable is not set are left out, so config.xml keeps its current value.
+
+    :param environ: the environment, e.g. os.environ
+    :type environ: dict
+    :return: a dict of element paths, relative to the MesosCloud element, to their new text
+    :rtype: dict
+    """
+    return dict((term, environ[var]) for var, term in MESOS_CLOUD_SETTINGS if environ.get(var))
+
+
+def changed_cloud_settings(cloud_settings, applied):
+    """Returns the settings whose value changed since they were last applied.
+    The package always sets every variable, so this is how a setting the
+    user changed is told apart from one that was since edited in the
+    Jenkins UI, which is kept.
+
+    :param cloud_settings: settings as returned by mesos_cloud_settings()
+    :type cloud_settings: dict
+    :param applied: the settings last applied, empty on the first start
+    :type applied: dict
+    :return: the subset of cloud_settings to apply
+    :rtype: dict
+    """
+    return dict((term, value) for term, value in cloud_settings.items() if applied.get(term) != value)
+
+
 def populate_jenkins_location_config(location_xml, url):
     """Modifies a Jenkins master's location config at runtime. This
     replaces the value of 'jenkinsUrl' with url.
@@ -61,61 +155,313 @@ def populate_jenkins_location_config(location_xml, url):
     tree.write(location_xml)
 
 
-def populate_nginx_config(config_file, nginx_port, jenkins_port, context):
-    """Modifies an nginx config, replacing the "magic" strings
+def prepare_reference_plugins(ref_plugins_dir, staging_dir):
+    """Moves every plugin archive in the reference plugins directory to the
+    staging directory and expands it there, the way Jenkins would on first
+    start, and records a checksum of each archive. The emptied reference
+    plugins directory is removed. Run at image build time.
+
+    Jenkins skips expanding a plugin whose '.timestamp2' file has the same
+    modification time as the archive, so this is set to match.
+
+    :param ref_plugins_dir: the path to the reference 'plugins' directory
+    :param staging_dir: the path to hold the archives and expanded plugins
+    :return: a dict of archive file name to SHA-256 checksum
+    :rtype: dict
+    """
+    import json
+    import shutil
+    import zipfile
+
+    if not os.path.exists(staging_dir):
+        os.makedirs(staging_dir)
+
+    checksums = {}
+    for archive in sorted(_plugin_archives(ref_plugins_dir)):
+        # move() keeps the mtime, which '.timestamp2' is matched to
+        archive_path = shutil.move(os.path.join(ref_plugins_dir, archive), os.path.join(staging_dir, archive))
+        dest_dir = os.path.join(staging_dir, os.path.splitext(archive)[0])
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        with zipfile.ZipFile(archive_path) as z:
+            z.extractall(dest_dir)
+        timestamp = os.path.join(dest_dir, '.timestamp2')
+        open(timestamp, 'w').close()
+        mtime = os.stat(archive_path).st_mtime_ns
+        os.utime(timestamp, ns=(mtime, mtime))
+        checksums[archive] = _sha256(archive_path)
+
+    with open(os.path.join(staging_dir, PLUGIN_CHECKSUMS), 'w') as f:
+        json.dump(checksums, f, indent=2, sort_keys=True)
+    shutil.rmtree(ref_plugins_dir, ignore_errors=True)
+    return checksums
+
+
+def sync_reference_plugins(ref_plugins_dir, plugins_dir):
+    """Copies reference plugins, with their pre-expanded directories, into
+    Jenkins' plugins directory. Only plugins whose checksum changed since the
+    last sync, or that are missing, are copied. Plugins installed by users
+    are left untouched.
+
+    :param ref_plugins_dir: the path to the staged reference plugins, see
+                            prepare_reference_plugins()
+    :param plugins_dir: the path to the 'plugins' directory in JENKINS_HOME
+    :return: the archive file names that were copied
+    :rtype: list
+    """
+    import json
+    import shutil
+
+    try:
+        with open(os.path.join(ref_plugins_dir, PLUGIN_CHECKSUMS), 'r') as f:
+            checksums = json.load(f)
+    except IOError:
+        print("WARNING: no plugin checksums in {}, skipping plugin sync.".format(ref_plugins_dir))
+        return []
+
+    synced_file = os.path.join(plugins_dir, SYNCED_PLUGIN_CHECKSUMS)
+    try:
+        with open(synced_file, 'r') as f:
+            synced = json.load(f)
+    except (IOError, ValueError):
+        synced = {}
+
+    if not os.path.exists(plugins_dir):
+        os.makedirs(plugins_dir)
+
+    copied = []
+    for archive, checksum in sorted(checksums.items()):
+        dest_archive = os.path.join(plugins_dir, archive)
+        if synced.get(archive) == checksum and os.path.exists(dest_archive):
+            continue
+        name = os.path.splitext(archive)[0]
+        dest_dir = os.path.join(plugins_dir, name)
+        shutil.rmtree(dest_dir, ignore_errors=True)
+        shutil.copytree(os.path.join(ref_plugins_dir, name), dest_dir)
+        shutil.copy2(os.path.join(ref_plugins_dir, archive), dest_archive)
+        synced[archive] = checksum
+        copied.append(archive)
+
+    if copied:
+        _write_atomically(synced_file, json.dumps(synced, indent=2, sort_keys=True))
+    return copied
+
+
+def read_startup_phases(timings_log):
+    """Pairs the begin and end marks recorded in a startup timings log.
+    Phases that haven't ended are left out.
+
+    :param timings_log: path to a log of '<phase> <begin|end> <ms>' lines
+    :return: a list of dicts with 'name', 'begin', 'end' and 'duration_ms',
+             in the order the phases began
+    :rtype: list
+    """
+    begins = {}
+    phases = []
+    with open(timings_log, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) != 3:
+                continue
+            name, event, millis = fields[0], fields[1], int(fields[2])
+            if event == 'begin':
+                begins[name] = millis
+            elif event == 'end' and name in begins:
+                phases.append({
+                    'name': name,
+                    'begin': begins[name],
+                    'end': millis,
+                    'duration_ms': millis - begins[name],
+                })
+    return sorted(phases, key=lambda p: p['begin'])
+
+
+def send_startup_metrics(phases, host, port):
+    """Sends each phase duration to statsd as a gauge named
+    '<STARTUP_METRIC_PREFIX>.<phase>_ms'.
+
+    :param phases: phases as returned by read_startup_phases()
+    :param host: the statsd host
+    :param port: the statsd UDP port
+    """
+    import socket
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for phase in phases:
+            metric = '{}.{}_ms:{}|g'.format(STARTUP_METRIC_PREFIX, phase['name'], phase['duration_ms'])
+            sock.sendto(metric.encode('utf-8'), (host, port))
+    except socket.error as e:
+        print("WARNING: could not send startup metrics to {}:{}: {}".format(host, port, e))
+    finally:
+        sock.close()
+
+
+def nginx_profile(cpus,
+                  worker_processes=0,
+                  worker_connections=0,
+                  upstream_keepalive=0,
+                  proxy_buffer_size='4k',
+                  proxy_buffers='4 32k',
+                  gzip=True,
+                  static_cache_size=0,
+                  static_cache_dir='/var/nginx/nginx-cache',
+                  jenkins_version='unknown'):
+    """Returns the nginx tuning placeholders and their values. A value of 0
+    for the worker and keepalive settings derives it from the task's CPUs.
+
+    :param cpus: the CPU shares allocated to the task, e.g. 1.0
+    :type cpus: float
+    :param worker_processes: number of nginx worker processes
+    :type worker_processes: int
+    :param worker_connections: maximum connections per worker
+    :type worker_connections: int
+    :param upstream_keepalive: idle keepalive connections to Jenkins, per worker
+    :type upstream_keepalive: int
+    :param proxy_buffer_size: size of the buffer for response headers, e.g. '4k'
+    :type proxy_buffer_size: str
+    :param proxy_buffers: number and size of response buffers, e.g. '4 32k'
+    :type proxy_buffers: str
+    :param gzip: whether to compress JSON, JS, CSS and text responses
+    :type gzip: bool
+    :param static_cache_size: maximum size in MB of the static resource
+                              cache, 0 disables the cache
+    :type static_cache_size: int
+    :param static_cache_dir: directory holding the static resource cache
+    :type static_cache_dir: str
+    :param jenkins_version: the Jenkins build, used to version cache keys
+    :type jenkins_version: str
+    :rtype: dict
+    """
+    import math
+
+    workers = worker_processes or max(1, int(math.ceil(cpus)))
+    return {
+        '_XNGINX_WORKER_PROCESSES': str(workers),
+        '_XNGINX_WORKER_CONNECTIONS': str(worker_connections or max(1024, int(1024 * cpus))),
+        '_XNGINX_UPSTREAM_KEEPALIVE': str(upstream_keepalive or 16),
+        '_XNGINX_PROXY_BUFFER_SIZE': proxy_buffer_size,
+        '_XNGINX_PROXY_BUFFERS': proxy_buffers,
+        '_XNGINX_GZIP': 'on' if gzip else 'off',
+        '_XNGINX_STATIC_CACHE_DIR': static_cache_dir,
+        # nginx requires a positive max_size even when the cache is off
+        '_XNGINX_STATIC_CACHE_SIZE': '{}m'.format(static_cache_size or 1),
+        '_XNGINX_STATIC_CACHE': 'jenkins_static' if static_cache_size else 'off',
+        '_XJENKINS_VERSION': jenkins_version,
+    }
+
+
+def populate_nginx_config(template_file, config_file, nginx_port, jenkins_port, context, profile=None):
+    """Renders an nginx config from a template, replacing the "magic" strings
     '_XNGINX_PORT', '_XJENKINS_PORT' and '_XJENKINS_CONTEXT' with the real
-    value provided.
+    value provided, along with the tuning placeholders from `profile`. The
+    template is never modified, so this is safe to run on every start. The
+    config is only rewritten when its content changes.
 
-    :param config_file: the path to an 'nginx.conf'
+    :param template_file: the path to the 'nginx.conf' template
+    :param config_file: the path to the rendered 'nginx.conf'
     :param nginx_port: the Mesos port the task is running on
     :param jenkins_port: the Mesos port the task is running on
     :param context: the application's context, e.g. '/service/jenkins'
+    :param profile: placeholder values as returned by nginx_profile(),
+                    defaults to the profile for a single CPU
+    :return: True if the config file was (re)written
+    :rtype: bool
     """
-    original = None
-    with open(config_file, 'r') as f:
-        original = f.readlines()
+    import hashlib
+    import re
 
-    with open(config_file, 'w') as f:
-        for line in original:
-            if re.match(r'.*_XNGINX_PORT.*', line):
-                f.write(re.sub('_XNGINX_PORT', nginx_port, line))
-            elif re.match(r'.*_XJENKINS_PORT.*', line):
-                f.write(re.sub('_XJENKINS_PORT', jenkins_port, line))
-            elif re.match(r'.*_XJENKINS_CONTEXT.*', line):
-                f.write(re.sub('_XJENKINS_CONTEXT', context, line))
-            else:
-                f.write(line)
+    values = dict(profile or nginx_profile(1.0))
+    values.update({
+        '_XNGINX_PORT': nginx_port,
+        '_XJENKINS_PORT': jenkins_port,
+        '_XJENKINS_CONTEXT': context,
+    })
+    # longest first, so no placeholder can shadow another it is a prefix of
+    pattern = '|'.join(sorted(values, key=len, reverse=True))
+
+    with open(template_file, 'r') as f:
+        rendered = re.sub(pattern, lambda m: values[m.group(0)], f.read())
+
+    try:
+        with open(config_file, 'rb') as f:
+            current_digest = hashlib.sha256(f.read()).digest()
+    except IOError:
+        current_digest = None
 
+    if current_digest == hashlib.sha256(rendered.encode('utf-8')).digest():
+        return False
 
-def populate_known_hosts(hosts, dest_file):
+    _write_atomically(config_file, rendered)
+    return True
+
+
+def populate_known_hosts(hosts, dest_file,
+                         timeout=DEFAULT_KEYSCAN_TIMEOUT,
+                         deadline=DEFAULT_KEYSCAN_DEADLINE,
+                         cache_ttl=DEFAULT_KNOWN_HOSTS_CACHE_TTL):
     """Gather SSH public key from one or more hosts and write out the
     known_hosts file.
 
+    Keys are cached next to `dest_file`, keyed by the host list. While the
+    cache is younger than `cache_ttl` only hosts without a cached key are
+    scanned. Hosts are scanned concurrently and the whole scan is bounded by
+    `deadline`; a host that can't be scanned in time keeps its previously
+    cached key, if any.
+
     :param hosts: a string of hosts separated by whitespace
     :param dest_file: absolute path to the SSH known hosts file
+    :param timeout: timeout in seconds for scanning a single host
+    :param deadline: timeout in seconds for scanning all hosts
+    :param cache_ttl: maximum age in seconds of the cached host keys
     """
+    import json
+    from concurrent import futures
+
     dest_dir = os.path.dirname(dest_file)
 
     if not os.path.exists(dest_dir):
         os.makedirs(dest_dir)
 
-    command = ['ssh-keyscan'] + hosts.split()
-    subprocess.call(
-        command, stdout=open(dest_file, 'w'), stderr=open(os.devnull, 'w'))
-
-
-def main():
+    host_list = hosts.split()
+    cache_file = '{}.cache.json'.format(dest_file)
+    cache = _read_known_hosts_cache(cache_file)
+    cached_keys = cache.get('keys', {})
+
+    if cache.get('hosts') == sorted(host_list) and time.time() - cache.get('created', 0) < cache_ttl:
+        created = cache['created']
+        to_scan = [h for h in host_list if not cached_keys.get(h)]
+    else:
+        created = time.time()
+        to_scan = host_list
+
+    keys = dict((h, cached_keys.get(h, '')) for h in host_list)
+    if to_scan:
+        limit = min(timeout * 2, deadline)
+        with futures.ThreadPoolExecutor(max_workers=len(to_scan)) as executor:
+            scanned = executor.map(lambda h: _keyscan(h, timeout, limit), to_scan)
+            for host, key in zip(to_scan, scanned):
+                if key:
+                    keys[host] = key
+                elif keys[host]:
+                    print("WARNING: using cached SSH host key for {}.".format(host))
+
+        _write_atomically(cache_file, json.dumps(
+            {'hosts': sorted(host_list), 'created': created, 'keys': keys}))
+
+    _write_atomically(dest_file, ''.join(keys[h] for h in host_list))
+
+
+def configure():
+    start = time.monotonic()
     try:
         jenkins_agent_user = os.environ['JENKINS_AGENT_USER']
         jenkins_agent_role = os.environ['JENKINS_AGENT_ROLE']
         jenkins_home_dir = os.environ['JENKINS_HOME']
         jenkins_framework_name = os.environ['JENKINS_FRAMEWORK_NAME']
         jenkins_app_context = os.environ['JENKINS_CONTEXT']
-        marathon_host = os.environ['HOST']
         marathon_nginx_port = os.environ['PORT0']
         marathon_jenkins_port = os.environ['PORT1']
         mesos_master = os.environ['JENKINS_MESOS_MASTER']
-        ssh_known_hosts = os.environ['SSH_KNOWN_HOSTS']
         marathon_name = os.environ['MARATHON_NAME']
     except KeyError as e:
         # Since each of the environment variables above are set either in the
@@ -128,7 +474,34 @@ def main():
     jenkins_root_url = os.getenv(
         'JENKINS_ROOT_URL',
         mesos_dns_taskname(jenkins_framework_name, marathon_name, marathon_nginx_port))
-
+    budget = float(os.getenv('BOOTSTRAP_BUDGET_SECONDS', DEFAULT_BUDGET_SECONDS))
+    profile = nginx_profile(
+        float(os.getenv('MARATHON_APP_RESOURCE_CPUS', 1.0)),
+        int(os.getenv('NGINX_WORKER_PROCESSES', 0)),
+        int(os.getenv('NGINX_WORKER_CONNECTIONS', 0)),
+        int(os.getenv('NGINX_UPSTREAM_KEEPALIVE', 0)),
+        os.getenv('NGINX_PROXY_BUFFER_SIZE', '4k'),
+        os.getenv('NGINX_PROXY_BUFFERS', '4 32k'),
+        os.getenv('NGINX_GZIP', 'true').lower() == 'true',
+        int(os.getenv('NGINX_STATIC_CACHE_SIZE', 0)),
+        os.path.join(os.getenv('MESOS_SANDBOX', '/var/nginx'), 'nginx-cache'),
+        os.getenv('JENKINS_VERSION', 'unknown'))
+    warm_pool = None
+    if os.getenv('JENKINS_AGENT_WARM_POOL_MIN'):
+        warm_pool = (int(os.environ['JENKINS_AGENT_WARM_POOL_MIN']),
+                     int(os.getenv('JENKINS_AGENT_WARM_POOL_MAX', 0)))
+
+    cloud_settings = mesos_cloud_settings(os.environ)
+    applied_file = os.path.join(jenkins_home_dir, APPLIED_CLOUD_SETTINGS)
+    applied = _read_json(applied_file)
+    record = dict(cloud_settings)
+    if warm_pool is not None:
+        record[APPLIED_WARM_POOL] = list(warm_pool)
+        # like the cloud settings, only rewrite a warm pool the user changed
+        if applied.get(APPLIED_WARM_POOL) == record[APPLIED_WARM_POOL]:
+            warm_pool = None
+
+    _mark_phase('bootstrap_config', 'begin')
     populate_jenkins_config_xml(
         os.path.join(jenkins_home_dir, 'config.xml'),
         mesos_master,
@@ -136,23 +509,240 @@ def main():
         marathon_nginx_port,
         jenkins_agent_role,
         jenkins_agent_user,
-        marathon_name)
+        marathon_name,
+        changed_cloud_settings(cloud_settings, applied),
+        warm_pool)
+    if record != applied:
+        import json
+        _write_atomically(applied_file, json.dumps(record, indent=2, sort_keys=True))
 
     populate_jenkins_location_config(os.path.join(
         jenkins_home_dir, 'jenkins.model.JenkinsLocationConfiguration.xml'),
         jenkins_root_url)
-
-    populate_known_hosts(ssh_known_hosts,
-                         "{}/.ssh/ssh_known_hosts".format(jenkins_home_dir))
-
-    # nginx changes here are really "run once". The context should never
-    # change as long as a Jenkins instance is alive, since the rewrite will
-    # be based on the app ID in Marathon, as will the volume on disk.
+    _mark_phase('bootstrap_config', 'end')
+
+    _mark_phase('bootstrap_plugins', 'begin')
+    copied = sync_reference_plugins(
+        JENKINS_PLUGIN_STAGING,
+        os.path.join(jenkins_home_dir, 'plugins'))
+    print("bootstrap: copied {} changed reference plugin(s).".format(len(copied)))
+    _mark_phase('bootstrap_plugins', 'end')
+
+    # nginx.conf is rendered from an immutable template on every start, so
+    # ports newly assigned by Marathon are always picked up.
+    _mark_phase('bootstrap_nginx', 'begin')
     populate_nginx_config(
-        '/var/nginx/nginx.conf',
+        NGINX_TEMPLATE,
+        NGINX_CONFIG,
         marathon_nginx_port,
         marathon_jenkins_port,
-        jenkins_app_context)
+        jenkins_app_context,
+        profile)
+    _mark_phase('bootstrap_nginx', 'end')
+
+    elapsed = time.monotonic() - start
+    print("bootstrap: configured in {:.3f}s".format(elapsed))
+    if elapsed > budget:
+        print("WARNING: bootstrap exceeded its startup budget of {:.3f}s.".format(budget))
+    return 0
+
+
+def known_hosts():
+    try:
+        jenkins_home_dir = os.environ['JENKINS_HOME']
+        ssh_known_hosts = os.environ['SSH_KNOWN_HOSTS']
+    except KeyError as e:
+        print("ERROR: missing required environment variable {}.".format(e.args[0]))
+        return 1
+
+    timeout = int(os.getenv('SSH_KEYSCAN_TIMEOUT', DEFAULT_KEYSCAN_TIMEOUT))
+    deadline = int(os.getenv('SSH_KEYSCAN_DEADLINE', DEFAULT_KEYSCAN_DEADLINE))
+    cache_ttl = int(os.getenv('SSH_KNOWN_HOSTS_CACHE_TTL', DEFAULT_KNOWN_HOSTS_CACHE_TTL))
+    start = time.monotonic()
+    _mark_phase('known_hosts', 'begin')
+    populate_known_hosts(ssh_known_hosts,
+                         "{}/.ssh/ssh_known_hosts".format(jenkins_home_dir),
+                         timeout,
+                         deadline,
+                         cache_ttl)
+    _mark_phase('known_hosts', 'end')
+    print("bootstrap: populated known hosts in {:.3f}s".format(time.monotonic() - start))
+    return 0
+
+
+def startup_report():
+    """Writes the recorded startup phases as JSON into the sandbox and sends
+    their durations to statsd, if it is available."""
+    import json
+
+    timings_log = os.getenv('STARTUP_TIMINGS_LOG')
+    if not timings_log:
+        print("ERROR: STARTUP_TIMINGS_LOG is not set.")
+        return 1
+
+    phases = read_startup_phases(timings_log)
+    report_file = os.path.join(os.path.dirname(timings_log), 'startup-timings.json')
+    _write_atomically(report_file, json.dumps({'phases': phases}, indent=2))
+
+    statsd_host = os.getenv('STATSD_UDP_HOST')
+    statsd_port = os.getenv('STATSD_UDP_PORT')
+    if statsd_host and statsd_port:
+        send_startup_metrics(phases, statsd_host, int(statsd_port))
+
+    for phase in phases:
+        print("bootstrap: startup phase {name} took {duration_ms}ms".format(**phase))
+    return 0
+
+
+def prepare_image():
+    """Pre-expands the Jenkins WAR into its webroot and the reference plugins
+    into their directories, so a new container doesn't have to."""
+    import zipfile
+
+    war = os.path.join(JENKINS_FOLDER, 'jenkins.war')
+    webroot = os.path.join(JENKINS_FOLDER, 'war')
+    with zipfile.ZipFile(war) as z:
+        z.extractall(webroot)
+    # Jenkins re-extracts the WAR unless this matches the WAR's mtime
+    timestamp = os.path.join(webroot, '.timestamp')
+    open(timestamp, 'w').close()
+    mtime = os.stat(war).st_mtime_ns
+    os.utime(timestamp, ns=(mtime, mtime))
+
+    checksums = prepare_reference_plugins(os.path.join(JENKINS_STAGING, 'plugins'), JENKINS_PLUGIN_STAGING)
+    print("bootstrap: expanded {} and {} plugin(s).".format(war, len(checksums)))
+    return 0
+
+
+COMMANDS = {
+    'configure': configure,
+    'known-hosts': known_hosts,
+    'prepare-image': prepare_image,
+    'startup-report': startup_report,
+}
+
+
+def main(argv=None):
+    args = sys.argv[1:] if argv is None else argv
+    command = args[0] if args else 'configure'
+    if command not in COMMANDS:
+        print("usage: bootstrap.py [{}]".format('|'.join(sorted(COMMANDS))))
+        return 2
+    return COMMANDS[command]()
+
+
+def _keyscan(host, timeout, limit):
+    """Return the ssh-keyscan output for a single host, or an empty string
+    if the host could not be scanned in time.
+
+    :param host: the host to scan
+    :type host: str
+    :param timeout: timeout in seconds passed to ssh-keyscan
+    :type timeout: int
+    :param limit: hard limit in seconds on the ssh-keyscan process
+    :type limit: int
+    :rtype: str
+    """
+    import subprocess
+
+    command = ['ssh-keyscan', '-T', str(timeout), host]
+    try:
+        result = subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            # ssh-keyscan's own timeout applies per connection attempt, so
+            # also bound the whole subprocess
+            timeout=limit)
+    except subprocess.TimeoutExpired:
+        print("WARNING: ssh-keyscan of {} timed out after {}s.".format(host, limit))
+        return ''
+    return result.stdout
+
+
+def _mark_phase(name, event):
+    """Append a begin or end mark for a startup phase to the timings log
+    started by run.sh. Does nothing when run outside of run.sh.
+
+    :param name: the phase name
+    :type name: str
+    :param event: 'begin' or 'end'
+    :type event: str
+    """
+    timings_log = os.getenv('STARTUP_TIMINGS_LOG')
+    if timings_log:
+        with open(timings_log, 'a') as f:
+            f.write('{} {} {}\n'.format(name, event, int(time.time() * 1000)))
+
+
+def _plugin_archives(plugins_dir):
+    """Return the file names of the plugin archives in a directory.
+
+    :param plugins_dir: path to a 'plugins' directory
+    :type plugins_dir: str
+    :rtype: list
+    """
+    return [f for f in os.listdir(plugins_dir) if f.endswith(('.jpi', '.hpi'))]
+
+
+def _sha256(path):
+    """Return the hex SHA-256 digest of a file.
+
+    :param path: path to the file
+    :type path: str
+    :rtype: str
+    """
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_known_hosts_cache(cache_file):
+    """Return the decoded SSH host key cache, or an empty dict if it is
+    missing or unreadable.
+
+    :param cache_file: path to the cache file
+    :type cache_file: str
+    :rtype: dict
+    """
+    return _read_json(cache_file)
+
+
+def _read_json(path):
+    """Return the decoded JSON file, or an empty dict if it is missing or
+    unreadable.
+
+    :param path: path to the JSON file
+    :type path: str
+    :rtype: dict
+    """
+    import json
+
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _write_atomically(dest_file, content):
+    """Write content to a temporary file and rename it over dest_file, so
+    readers never see a partially written file.
+
+    :param dest_file: path to the file to write
+    :type dest_file: str
+    :param content: the new file content
+    :type content: str
+    """
+    tmp_file = '{}.tmp'.format(dest_file)
+    with open(tmp_file, 'w') as f:
+        f.write(content)
+    os.replace(tmp_file, dest_file)
 
 
 def _get_xml_root(config_xml):
@@ -163,11 +753,51 @@ def _get_xml_root(config_xml):
     :return: a tuple (tree,root)
     :rtype: tuple
     """
+    import xml.etree.ElementTree as ET
+
     tree = ET.parse(config_xml)
     root = tree.getroot()
     return tuple([tree, root])
 
 
+def _set_warm_pool(slave_info, warm_pool_min, warm_pool_max):
+    """Replace the warm pool environment variables in a MesosSlaveInfo's
+    node properties, keeping any other node properties. A minimum of 0
+    removes the warm pool.
+
+    :param slave_info: MesosSlaveInfo XML element
+    :type slave_info: xml.etree.ElementTree.Element
+    :param warm_pool_min: idle agents to keep for the label
+    :type warm_pool_min: int
+    :param warm_pool_max: upper bound on idle agents, including those for queued builds
+    :type warm_pool_max: int
+    """
+    import xml.etree.ElementTree as ET
+
+    properties = slave_info.find('./nodeProperties')
+    if properties is None:
+        if warm_pool_min <= 0:
+            return
+        properties = ET.SubElement(slave_info, 'nodeProperties')
+    for prop in properties.findall('./hudson.slaves.EnvironmentVariablesNodeProperty'):
+        if 'WARM_POOL_MIN' in [e.text for e in prop.iter('string')]:
+            properties.remove(prop)
+    if warm_pool_min <= 0:
+        return
+
+    env = {'WARM_POOL_MIN': warm_pool_min, 'WARM_POOL_MAX': max(warm_pool_min, warm_pool_max)}
+    prop = ET.SubElement(properties, 'hudson.slaves.EnvironmentVariablesNodeProperty')
+    # the XStream form of hudson.EnvVars, a case-insensitive TreeMap
+    env_vars = ET.SubElement(prop, 'envVars', serialization='custom')
+    ET.SubElement(env_vars, 'unserializable-parents')
+    tree_map = ET.SubElement(env_vars, 'tree-map')
+    ET.SubElement(ET.SubElement(tree_map, 'default'), 'comparator', {'class': 'hudson.util.CaseInsensitiveComparator'})
+    ET.SubElement(tree_map, 'int').text = str(len(env))
+    for key in sorted(env):
+        ET.SubElement(tree_map, 'string').text = key
+        ET.SubElement(tree_map, 'string').text = str(env[key])
+
+
 def _find_and_set(element, term, new_text, write_if_empty=False):
     """Find the desired term within the XML element and replace
     its text with text.
@@ -0,0 +1,73 @@
+import hudson.model.Computer
+import hudson.model.Label
+import hudson.slaves.EnvironmentVariablesNodeProperty
+import java.util.concurrent.TimeUnit
+import jenkins.model.*
+import jenkins.util.Timer
+import org.jenkinsci.plugins.mesos.MesosCloud
+import org.jenkinsci.plugins.mesos.MesosSlave
+
+// Keeps a pool of idle Mesos agents ready for each label that asks for one,
+// so queued builds don't wait for an offer, an image pull and a JNLP connect.
+// A label opts in with WARM_POOL_MIN (and optionally WARM_POOL_MAX) set as
+// environment variable node properties on its MesosSlaveInfo. The pool holds
+// WARM_POOL_MIN idle agents plus one per build queued for the label, up to
+// WARM_POOL_MAX. Idle agents are still terminated after the label's
+// idleTerminationMinutes and are replaced on the next check.
+
+def intervalSeconds = (System.getenv("JENKINS_WARM_POOL_INTERVAL") ?: "30") as Long
+def inFlight = [:].withDefault { [] }
+
+def warmPoolSize = { slaveInfo ->
+  def env = [:]
+  slaveInfo.getNodeProperties()?.each { prop ->
+    if (prop instanceof EnvironmentVariablesNodeProperty) {
+      env.putAll(prop.getEnvVars())
+    }
+  }
+  def min = (env["WARM_POOL_MIN"] ?: "0") as Integer
+  def max = (env["WARM_POOL_MAX"] ?: "${min}") as Integer
+  return [min, Math.max(min, max)]
+}
+
+def replenish = {
+  def cloud = MesosCloud.get()
+  if (cloud == null) {
+    return
+  }
+  cloud.getSlaveInfos().each { slaveInfo ->
+    def (min, max) = warmPoolSize(slaveInfo)
+    if (min <= 0) {
+      return
+    }
+    def labelString = slaveInfo.getLabelString()
+    def label = Label.get(labelString)
+    def idle = label.getNodes().count { node ->
+      def computer = node.toComputer()
+      node instanceof MesosSlave && computer != null && computer.isIdle()
+    }
+    inFlight[labelString] = inFlight[labelString].findAll { !it.isDone() }
+    def queued = Jenkins.getInstance().getQueue().countBuildableItemsFor(label)
+    def missing = Math.min(max, min + queued) - idle - inFlight[labelString].size()
+    if (missing <= 0) {
+      return
+    }
+
+    println "--> [warm-pool] ${labelString}: ${idle} idle, ${queued} queued, provisioning ${missing} agent(s)"
+    cloud.provision(label, missing * slaveInfo.getMaxExecutors()).each { plannedNode ->
+      // outside of the NodeProvisioner nobody else adds the new node
+      inFlight[labelString] << Computer.threadPoolForRemoting.submit({
+        Jenkins.getInstance().addNode(plannedNode.future.get())
+      } as Runnable)
+    }
+  }
+}
+
+Timer.get().scheduleWithFixedDelay({
+  try {
+    replenish()
+  } catch (Throwable t) {
+    println "--> [warm-pool] failed to replenish agents: ${t}"
+  }
+} as Runnable, intervalSeconds, intervalSeconds, TimeUnit.SECONDS)
+println "--> [warm-pool] checking warm agent pools every ${intervalSeconds}s"
@@ -0,0 +1,83 @@
+#!/bin/bash
+#
+# Derive JVM heap and GC settings from the container's cgroup
+# limits and prepend them to JVM_OPTS. Anything already set in
+# JVM_OPTS (the advanced.jvm-opts option) comes later on the
+# java command line and so takes precedence.
+#
+# Set JVM_AUTO_TUNE=false to pass JVM_OPTS through unchanged.
+
+# Print the container memory limit in MB, falling back to the
+# memory Marathon allocated to the task.
+container_mem_mb()
+{
+	local limit=""
+	if [ -f /sys/fs/cgroup/memory.max ]; then
+		limit=$(cat /sys/fs/cgroup/memory.max)
+	elif [ -f /sys/fs/cgroup/memory/memory.limit_in_bytes ]; then
+		limit=$(cat /sys/fs/cgroup/memory/memory.limit_in_bytes)
+	fi
+	# "max" or a near-2^63 value means no limit was set
+	if [ -n "$limit" ] && [ "$limit" != "max" ] && [ ${#limit} -lt 16 ]; then
+		echo $((limit / 1024 / 1024))
+	else
+		printf "%.0f\n" "${MARATHON_APP_RESOURCE_MEM:-4096}"
+	fi
+}
+
+# Print the number of CPUs available to the container, rounded up,
+# falling back to the CPUs Marathon allocated to the task.
+container_cpus()
+{
+	local quota="" period=""
+	if [ -f /sys/fs/cgroup/cpu.max ]; then
+		read quota period < /sys/fs/cgroup/cpu.max
+	elif [ -f /sys/fs/cgroup/cpu/cpu.cfs_quota_us ]; then
+		quota=$(cat /sys/fs/cgroup/cpu/cpu.cfs_quota_us)
+		period=$(cat /sys/fs/cgroup/cpu/cpu.cfs_period_us)
+	fi
+	if [ -n "$quota" ] && [ "$quota" != "max" ] && [ "$quota" -gt 0 ]; then
+		echo $(((quota + period - 1) / period))
+	else
+		awk -v c="${MARATHON_APP_RESOURCE_CPUS:-1}" 'BEGIN { n = int(c); if (n < c) n++; if (n < 1) n = 1; print n }'
+	fi
+}
+
+tune_jvm()
+{
+	if [ "$JVM_AUTO_TUNE" = "false" ]; then
+		echo "jvm-opts: auto-tuning disabled, using JVM_OPTS as given"
+		return
+	fi
+
+	local mem_mb=$(container_mem_mb)
+	local cpus=$(container_cpus)
+
+	# Leave room for metaspace, thread stacks, nginx and off-heap buffers.
+	local heap_mb=$((mem_mb * ${JVM_HEAP_PERCENT:-60} / 100))
+	local metaspace_mb=$((mem_mb / 8))
+	[ $metaspace_mb -gt 512 ] && metaspace_mb=512
+	[ $metaspace_mb -lt 128 ] && metaspace_mb=128
+
+	# G1 works best with around 2048 regions of 1-32 MB, a power of two.
+	local region_mb=1
+	while [ $((region_mb * 2048)) -lt $heap_mb ] && [ $region_mb -lt 32 ]; do
+		region_mb=$((region_mb * 2))
+	done
+
+	local gc_threads=$cpus
+	local conc_gc_threads=$(((gc_threads + 3) / 4))
+
+	local tuned="-Xms${heap_mb}m -Xmx${heap_mb}m"
+	tuned="$tuned -XX:MaxMetaspaceSize=${metaspace_mb}m"
+	tuned="$tuned -XX:+UseG1GC -XX:G1HeapRegionSize=${region_mb}m"
+	tuned="$tuned -XX:ParallelGCThreads=${gc_threads} -XX:ConcGCThreads=${conc_gc_threads}"
+
+	echo "jvm-opts: container has ${mem_mb} MB and ${cpus} CPU(s); using ${tuned}"
+	JVM_OPTS="$tuned $JVM_OPTS"
+}
+
+tune_jvm
+
+# pass on new values
+export JVM_OPTS
@@ -1,16 +1,36 @@
 #!/bin/bash
 
+. /usr/local/jenkins/bin/startup-timing.sh
+phase_begin total
+
 export LD_LIBRARY_PATH=/libmesos-bundle/lib:/libmesos-bundle/lib/mesos:$LD_LIBRARY_PATH
 export JENKINS_SLAVE_AGENT_PORT=$PORT_AGENT
 export MESOS_NATIVE_JAVA_LIBRARY=$(ls /libmesos-bundle/lib/libmesos-*.so)
 
+phase_begin export_libssl
 . /usr/local/jenkins/bin/export-libssl.sh
+phase_end export_libssl
 
+phase_begin bootstrap
 /usr/local/jenkins/bin/bootstrap.py
+phase_end bootstrap
+# SSH host keys are only needed once builds start, so scan them in the
+# background instead of delaying nginx and Jenkins.
+/usr/local/jenkins/bin/bootstrap.py known-hosts &
+
+phase_begin dcos_account
 . /usr/local/jenkins/bin/dcos-account.sh
+phase_end dcos_account
+. /usr/local/jenkins/bin/jvm-opts.sh
+
+phase_begin nginx
+nginx -c /var/nginx/nginx.conf || exit 1
+phase_end nginx
+
+phase_begin jenkins
+report_when_ready &
 
-nginx -c /var/nginx/nginx.conf    \
-  && java ${JVM_OPTS}                                \
+java ${JVM_OPTS}                                \
      -Dhudson.model.DirectoryBrowserSupport.CSP="${JENKINS_CSP_OPTS}" \
      -Dhudson.udp=-1                                 \
      -Djava.awt.headless=true                        \
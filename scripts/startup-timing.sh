@@ -0,0 +1,34 @@
+#!/bin/bash
+#
+# Record when each master startup phase begins and ends. Marks
+# are appended to $STARTUP_TIMINGS_LOG as "<phase> <begin|end> <ms>"
+# lines; bootstrap.py adds its own phases to the same file and
+# turns it into a JSON report once Jenkins is ready.
+
+STARTUP_TIMINGS_LOG="${MESOS_SANDBOX:-/tmp}/startup-phases.log"
+export STARTUP_TIMINGS_LOG
+
+: > "$STARTUP_TIMINGS_LOG"
+
+phase_begin()
+{
+	echo "$1 begin $(date +%s%3N)" >> "$STARTUP_TIMINGS_LOG"
+}
+
+phase_end()
+{
+	echo "$1 end $(date +%s%3N)" >> "$STARTUP_TIMINGS_LOG"
+}
+
+# Wait for Jenkins to answer on its own port, then close the
+# "jenkins" phase and write the report. Run in the background.
+report_when_ready()
+{
+	local url="http://127.0.0.1:${PORT1}${JENKINS_CONTEXT}/login"
+	until [ "$(curl -s -o /dev/null -w '%{http_code}' "$url")" = "200" ]; do
+		sleep 1
+	done
+	phase_end jenkins
+	phase_end total
+	/usr/local/jenkins/bin/bootstrap.py startup-report
+}
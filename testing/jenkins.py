@@ -1,17 +1,48 @@
+import base64
+import json
 import logging
 import os
+import random
+import re
+import time
 from xml.etree import ElementTree
 
 import jenkins_remote_access
 import sdk_cmd
 import sdk_install
+import sdk_marathon
 from shakedown import *
 
 TIMEOUT_SECONDS = 15 * 60
 SHORT_TIMEOUT_SECONDS = 30
+# Size of the local persistent volume of masters installed by install()
+LOCAL_VOLUME_SIZE_MB = 1024
+
+# Minute field prefixes of the supported cron styles
+CRON_STYLES = {'fixed': '*', 'hashed': 'H'}
+
+# Default fields fetched from the Jenkins JSON API; the full documents
+# are megabytes on masters with many jobs and long build histories.
+JOBS_TREE = 'jobs[name,url,color]'
+JOB_TREE = ('name,url,color,buildable,inQueue,nextBuildNumber,'
+            'firstBuild[number,url],lastBuild[number,url],lastCompletedBuild[number,url]')
+BUILDS_TREE = 'builds[number,url]'
+BUILD_TREE = 'number,url,result,building,duration,estimatedDuration,timestamp,queueId'
+
+# Stand-ins for the per-master options of install_group(), rendered into
+# one app definition per distinct set of the other options
+GROUP_PLACEHOLDERS = {
+    'service_name': 'jenkins-group-service-name',
+    'volume_name': 'jenkins-group-volume-name',
+    'secret_name': 'jenkins-group-secret-name',
+    'pinned_hostname': 'jenkins-group-pinned-hostname',
+}
 
 log = logging.getLogger(__name__)
 
+# options JSON -> app definition rendered with GROUP_PLACEHOLDERS
+_group_templates = {}
+
 
 def install(service_name, client,
             role=None,
@@ -19,7 +50,8 @@ def install(service_name, client,
             strict_settings=None,
             service_user=None,
             fn=None,
-            mom=None):
+            mom=None,
+            pinned_hostname=None):
     """Install a Jenkins instance and set the service name to
     `service_name`. This does not wait for deployment to finish.
 
@@ -32,6 +64,8 @@ def install(service_name, client,
             mesos principal to use in strict mode.
         service_user: user
         fn: Function to determine if install is complete
+        mom: Marathon on Marathon service name
+        pinned_hostname: Agent hostname to run the master on
     """
     def _wait_for_deployment(app_id, client):
         return len(client.get_deployments(app_id)) == 0
@@ -40,6 +74,64 @@ def install(service_name, client,
     if not fn:
         fn = _wait_for_deployment
 
+    options = _install_options(service_name,
+                               role=role,
+                               external_volume=external_volume,
+                               strict_settings=strict_settings,
+                               service_user=service_user,
+                               pinned_hostname=pinned_hostname)
+
+    # get the package json for given options
+    pkg_json = sdk_install.get_package_json('jenkins', None, options)
+    if mom:
+        pkg_json["env"]["MARATHON_NAME"] = mom
+    client.add_app(pkg_json)
+    time_wait(lambda: fn(service_name, client),
+              TIMEOUT_SECONDS,
+              sleep_seconds=20)
+
+
+def install_group(installs, mom=None, wait=True, timeout_seconds=TIMEOUT_SECONDS):
+    """Install several Jenkins instances as one Marathon deployment.
+
+    The package is rendered once for each distinct set of options with
+    the per-master ones (service name, volume name, secret name and
+    pinned hostname) left as placeholders, and each master's values are
+    patched into a copy. All the apps are then created with a single
+    bulk PUT to Marathon's /v2/apps.
+
+    Args:
+        installs: Dict of service name to the install() options for
+            it: role, external_volume, strict_settings, service_user
+            and pinned_hostname
+        mom: Marathon on Marathon service name
+        wait: Wait for the deployment to finish
+        timeout_seconds: How long to wait for the deployment
+
+    Returns: The Marathon deployment ID.
+    """
+    apps = [_render_app(service_name, mom=mom, **kwargs)
+            for service_name, kwargs in installs.items()]
+    log.info("Deploying {} Jenkins instances as one group".format(len(apps)))
+    r = sdk_cmd.cluster_request('PUT', sdk_marathon._api_url('apps', mom), log_args=False, json=apps)
+    deployment_id = r.json()['deploymentId']
+
+    def _deployment_done():
+        r = sdk_cmd.cluster_request('GET', sdk_marathon._api_url('deployments', mom), retry=False)
+        return deployment_id not in [d['id'] for d in r.json()]
+
+    if wait:
+        time_wait(_deployment_done, timeout_seconds, sleep_seconds=20)
+    return deployment_id
+
+
+def _install_options(service_name,
+                     role=None,
+                     external_volume=None,
+                     strict_settings=None,
+                     service_user=None,
+                     pinned_hostname=None):
+    """The package options install() renders for a master."""
     options = {
         "service": {
             "name": service_name
@@ -57,9 +149,12 @@ def install(service_name, client,
         }
     else:
         options["storage"] = {
-            "local-persistent-volume-size": 1024
+            "local-persistent-volume-size": LOCAL_VOLUME_SIZE_MB
         }
 
+    if pinned_hostname:
+        options["storage"]["pinned-hostname"] = pinned_hostname
+
     if strict_settings:
         options["security"] = {
             "secret-name": strict_settings['secret_name'],
@@ -69,14 +164,60 @@ def install(service_name, client,
     if service_user:
         options['service']['user'] = service_user
 
-    # get the package json for given options
-    pkg_json = sdk_install.get_package_json('jenkins', None, options)
+    return options
+
+
+def _render_app(service_name,
+                role=None,
+                external_volume=None,
+                strict_settings=None,
+                service_user=None,
+                pinned_hostname=None,
+                mom=None):
+    """The app definition install() would submit for `service_name`,
+    patched from a template shared by masters with the same options.
+    """
+    values = {'service_name': service_name}
+    if external_volume:
+        values['volume_name'] = service_name
+    if strict_settings:
+        values['secret_name'] = strict_settings['secret_name']
+    if pinned_hostname:
+        values['pinned_hostname'] = pinned_hostname
+
+    placeholders = {k: GROUP_PLACEHOLDERS[k] for k in values}
+    options = _install_options(placeholders['service_name'],
+                               role=role,
+                               external_volume=external_volume,
+                               strict_settings=strict_settings and {
+                                   'secret_name': placeholders['secret_name']},
+                               service_user=service_user,
+                               pinned_hostname=placeholders.get('pinned_hostname'))
+    if external_volume:
+        options["storage"]["external-persistent-volume-name"] = placeholders['volume_name']
+
+    key = json.dumps(options, sort_keys=True)
+    if key not in _group_templates:
+        _group_templates[key] = json.dumps(sdk_install.get_package_json('jenkins', None, options))
+
+    app = _group_templates[key]
+    for field, value in values.items():
+        # as it appears inside a JSON string
+        app = app.replace(GROUP_PLACEHOLDERS[field], json.dumps(value)[1:-1])
+    app = json.loads(app)
+    labels = app.get("labels", {})
+    if "DCOS_PACKAGE_OPTIONS" in labels:
+        # encoded, so the placeholders in it were not replaced above
+        options = _install_options(service_name,
+                                   role=role,
+                                   external_volume=external_volume,
+                                   strict_settings=strict_settings,
+                                   service_user=service_user,
+                                   pinned_hostname=pinned_hostname)
+        labels["DCOS_PACKAGE_OPTIONS"] = base64.b64encode(json.dumps(options).encode('utf-8')).decode('utf-8')
     if mom:
-        pkg_json["env"]["MARATHON_NAME"] = mom
-    client.add_app(pkg_json)
-    time_wait(lambda: fn(service_name, client),
-              TIMEOUT_SECONDS,
-              sleep_seconds=20)
+        app["env"]["MARATHON_NAME"] = mom
+    return app
 
 
 def uninstall(service_name, package_name='jenkins', role=None, mom=None):
@@ -118,12 +259,13 @@ def create_job(
         job_name,
         cmd="echo \"Hello World\"; sleep 30",
         schedule_frequency_in_min=1,
-        labelString=None
+        labelString=None,
+        **kwargs
 ):
     headers = {'Content-Type': 'application/xml'}
     svc_url = dcos_service_url(service_name)
     url = "{}createItem?name={}".format(svc_url, job_name)
-    job_config = construct_job_config(cmd, schedule_frequency_in_min, labelString)
+    job_config = construct_job_config(cmd, schedule_frequency_in_min, labelString, **kwargs)
 
     r = http.post(url, headers=headers, data=job_config)
 
@@ -166,14 +308,58 @@ def delete_all_jobs(service_name, retry=True):
             retry=retry)
 
 
-def construct_job_config(cmd, schedule_frequency_in_min, labelString):
+def cron_spec(schedule_frequency_in_min, style='fixed'):
+    """Cron spec that runs a job every X minutes. 'fixed' runs all jobs
+    at the same minute (*/X); 'hashed' lets Jenkins spread jobs over the
+    interval by a hash of the job name (H/X).
+    """
+    if style not in CRON_STYLES:
+        raise ValueError("Unknown cron style '{}', expected one of: {}".format(
+            style, ', '.join(sorted(CRON_STYLES))))
+    return '{}/{} * * * *'.format(CRON_STYLES[style], schedule_frequency_in_min)
+
+
+def construct_job_config(cmd, schedule_frequency_in_min, labelString, concurrent=False, parameters=(),
+                         cron_style='fixed', jitter_seconds=0):
+    """Build the config XML of a shell job from test-job.xml.
+
+    Args:
+        cmd: Shell command to run
+        schedule_frequency_in_min: Run every X minutes; None for a job
+            that only runs when triggered
+        labelString: Agent label to run on
+        concurrent: Allow builds of the job to run concurrently
+        parameters: Names of string parameters the job takes; builds
+            triggered with different values are never merged in the queue
+        cron_style: 'fixed' or 'hashed', see cron_spec()
+        jitter_seconds: Delay builds by a random quiet period of up to
+            this many seconds, to spread jobs within the same minute
+    """
     updated_job_config = _get_job_fixture('test-job.xml')
 
-    cron = '*/{} * * * *'.format(schedule_frequency_in_min)
-    updated_job_config.find('.//spec').text = cron
+    if schedule_frequency_in_min is None:
+        triggers = updated_job_config.find('.//triggers')
+        for trigger in list(triggers):
+            triggers.remove(trigger)
+    else:
+        cron = cron_spec(schedule_frequency_in_min, cron_style)
+        updated_job_config.find('.//spec').text = cron
+    if jitter_seconds:
+        quiet_period = ElementTree.SubElement(updated_job_config.getroot(), 'quietPeriod')
+        quiet_period.text = str(random.randint(0, jitter_seconds))
     updated_job_config.find('.//command').text = cmd
     if labelString:
         updated_job_config.find('.//assignedNode').text = labelString
+    updated_job_config.find('.//concurrentBuild').text = str(concurrent).lower()
+    if parameters:
+        definitions = ElementTree.SubElement(
+            ElementTree.SubElement(updated_job_config.find('.//properties'),
+                                   'hudson.model.ParametersDefinitionProperty'),
+            'parameterDefinitions')
+        for name in parameters:
+            definition = ElementTree.SubElement(definitions, 'hudson.model.StringParameterDefinition')
+            ElementTree.SubElement(definition, 'name').text = name
+            ElementTree.SubElement(definition, 'defaultValue')
     root = updated_job_config.getroot()
     xmlstr = ElementTree.tostring(root, encoding='utf8', method='xml')
 
@@ -196,6 +382,31 @@ def run_job(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, **kwa
     return sdk_cmd.service_request('POST', service_name, path, timeout_seconds=timeout_seconds)
 
 
+def build_job(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
+    path = 'job/{}/build'.format(job_name)
+    return sdk_cmd.service_request('POST', service_name, path, timeout_seconds=timeout_seconds)
+
+
+def trigger_build(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, **params):
+    """Queue a build of `job_name`, with `params` if the job takes any.
+
+    Returns: The ID of the queue item, to follow with a BuildTracker.
+    """
+    verb = 'buildWithParameters' if params else 'build'
+    path = 'job/{}/{}'.format(job_name, verb)
+    r = sdk_cmd.service_request('POST', service_name, path, timeout_seconds=timeout_seconds, params=params)
+    match = re.search(r'/queue/item/(\d+)', r.headers.get('Location', ''))
+    if not match:
+        raise ValueError("No queue item in response to {} of {}: {}".format(
+            verb, job_name, r.headers.get('Location')))
+    return int(match.group(1))
+
+
+def wait_for_build(service_name, job_name, queue_id, result=None, timeout_seconds=TIMEOUT_SECONDS):
+    """Wait for the build queued as `queue_id` to finish, see BuildTracker."""
+    return BuildTracker(service_name, job_name, queue_id).wait_for_build(result, timeout_seconds)
+
+
 def enable_job(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
     return _set_buildable(service_name, job_name, True, timeout_seconds)
 
@@ -216,52 +427,223 @@ def _set_buildable(service_name, job_name, buildable, timeout_seconds=SHORT_TIME
     return sdk_cmd.service_request('POST', service_name, path, timeout_seconds=timeout_seconds)
 
 
-def get_jobs(service_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    return _get_jenkins_root(service_name, timeout_seconds)['jobs']
+def get_jobs(service_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=JOBS_TREE):
+    return _get_jenkins_root(service_name, timeout_seconds, tree=tree)['jobs']
 
 
-def get_job(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    path = _get_jenkins_json_path(service_name, 'job/{}'.format(job_name))
-    return _get_jenkins_json(service_name, path, timeout_seconds)
+def get_job(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=JOB_TREE):
+    return query(service_name, 'job/{}'.format(job_name), tree=tree, timeout_seconds=timeout_seconds)
 
 
-def get_builds(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    return get_job(service_name, job_name)['builds']
+def get_builds(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=BUILDS_TREE):
+    return get_job(service_name, job_name, timeout_seconds, tree=tree)['builds']
 
 
-def get_build(service_name, job_name, number, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    path = _get_jenkins_json_path(service_name, 'job/{}/{}'.format(job_name, number))
-    return _get_jenkins_json(service_name, path, timeout_seconds)
+def get_build(service_name, job_name, number, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=BUILD_TREE):
+    path = 'job/{}/{}'.format(job_name, number)
+    return query(service_name, path, tree=tree, timeout_seconds=timeout_seconds)
 
 
-def get_first_build(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    return _get_named_build(service_name, job_name, 'firstBuild')
+def get_first_build(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=BUILD_TREE):
+    return _get_named_build(service_name, job_name, 'firstBuild', timeout_seconds, tree)
 
 
-def get_last_build(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    return _get_named_build(service_name, job_name, 'lastBuild')
+def get_last_build(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=BUILD_TREE):
+    return _get_named_build(service_name, job_name, 'lastBuild', timeout_seconds, tree)
 
 
-def _get_named_build(service_name, job_name, build_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    last_build = get_job(service_name, job_name)[build_name]
-    if last_build is None:
-        return None
+def get_queue_times(service_name, job_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
+    """Get how long, in milliseconds, each finished build of `job_name`
+    waited in the queue, as recorded by the metrics plugin.
 
-    return get_build(service_name, job_name, last_build['number'])
+    Returns: dict of build number to queue time
+    """
+    builds = get_builds(service_name, job_name, timeout_seconds,
+                        tree='builds[number,building,actions[queuingDurationMillis]]')
+    queue_times = {}
+    for build in builds:
+        if build['building']:
+            continue
+        for action in build['actions']:
+            if 'queuingDurationMillis' in action:
+                queue_times[build['number']] = action['queuingDurationMillis']
+    return queue_times
+
+
+class BuildTracker:
+    """Follows a triggered build from its queue item to completion.
+
+    The queue item is polled until it names its build, then only that
+    build is polled, each with a small tree filter. Responses that carry
+    an ETag or Last-Modified header are revalidated with conditional
+    requests. The polling interval backs off while nothing changes and,
+    once the build runs, follows its estimated remaining duration.
+
+    Jenkins drops an item about five minutes after it leaves the queue.
+    If the item is gone before the tracker saw it leave, the build is
+    found through its queueId instead and `queued_at` stays None.
+    """
 
+    QUEUE_TREE = 'id,cancelled,why,inQueueSince,executable[number,url]'
+
+    def __init__(self, service_name, job_name, queue_id, min_interval=1.0, max_interval=20.0):
+        self.service_name = service_name
+        self.job_name = job_name
+        self.queue_id = queue_id
+        self.number = None
+        # when the build was queued, in ms on the master's clock
+        self.queued_at = None
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._interval = min_interval
+        self._cache = {}
+
+    def poll(self):
+        """Returns the build JSON, or None while the build is queued."""
+        if self.number is None:
+            item = self._get('queue/item/{}'.format(self.queue_id), self.QUEUE_TREE, missing_ok=True)
+            if item is None:
+                self.number = self._find_build_number()
+                return self._get('job/{}/{}'.format(self.job_name, self.number), BUILD_TREE)
+            self.queued_at = item.get('inQueueSince', self.queued_at)
+            if item.get('cancelled'):
+                raise RuntimeError("Build of {} was cancelled in the queue".format(self.job_name))
+            if not item.get('executable'):
+                return None
+            self.number = item['executable']['number']
+        return self._get('job/{}/{}'.format(self.job_name, self.number), BUILD_TREE)
+
+    def wait_for_build(self, result=None, timeout_seconds=TIMEOUT_SECONDS):
+        """Wait for the build to finish and return its JSON.
+
+        Args:
+            result: Expected result, e.g. 'SUCCESS'; if given, any other
+                result raises an AssertionError as soon as the build ends
+            timeout_seconds: How long to wait before raising TimeoutError
+        """
+        deadline = time.time() + timeout_seconds
+        last = None
+        while True:
+            build = self.poll()
+            if build is not None and not build['building']:
+                if result is not None and build['result'] != result:
+                    raise AssertionError("Build {} of {} ended with {}, expected {}".format(
+                        self.number, self.job_name, build['result'], result))
+                return build
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError("Build of {} (queue item {}) did not finish in {}s".format(
+                    self.job_name, self.queue_id, timeout_seconds))
+            time.sleep(min(self._next_interval(build, last), remaining))
+            last = build
+
+    def _next_interval(self, build, last):
+        if build != last:
+            self._interval = self.min_interval
+        else:
+            self._interval = min(self._interval * 2, self.max_interval)
+        if build is not None and build.get('estimatedDuration', -1) > 0:
+            elapsed_ms = time.time() * 1000 - build['timestamp']
+            expected = (build['estimatedDuration'] - elapsed_ms) / 1000
+            return min(max(expected, self._interval), self.max_interval)
+        return self._interval
+
+    def _find_build_number(self):
+        """Returns the number of the build started from the queue item,
+        once Jenkins has dropped the item. This loads every build of the
+        job, so it is only used when the item is gone.
+        """
+        builds = get_job(self.service_name, self.job_name, tree='allBuilds[number,queueId]')['allBuilds']
+        for build in builds:
+            if build.get('queueId') == self.queue_id:
+                return build['number']
+        raise RuntimeError("Queue item {} of {} is gone and started no build".format(
+            self.queue_id, self.job_name))
+
+    def _get(self, path, tree, missing_ok=False):
+        """Get the JSON at `path`. With `missing_ok`, a 404 returns None
+        rather than raising.
+        """
+        headers = {}
+        cached = self._cache.get(path)
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['modified']:
+                headers['If-Modified-Since'] = cached['modified']
+        r = sdk_cmd.service_request('GET', self.service_name,
+                                    _get_jenkins_json_path(self.service_name, path),
+                                    raise_on_error=not missing_ok,
+                                    timeout_seconds=SHORT_TIMEOUT_SECONDS,
+                                    params={'tree': tree},
+                                    headers=headers)
+        if missing_ok:
+            if r.status_code == 404:
+                return None
+            r.raise_for_status()
+        if r.status_code == 304:
+            return cached['json']
+        self._cache[path] = {
+            'etag': r.headers.get('ETag'),
+            'modified': r.headers.get('Last-Modified'),
+            'json': r.json(),
+        }
+        return self._cache[path]['json']
 
-def _get_jenkins_root(service_name, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    return _get_jenkins_json(service_name, 'api/json', timeout_seconds)
 
+def query(service_name, path, tree=None, depth=None, timeout_seconds=SHORT_TIMEOUT_SECONDS):
+    """Get the JSON API of the Jenkins object at `path`, e.g. 'job/foo'.
 
-def _get_jenkins_json(service_name, path, timeout_seconds=SHORT_TIMEOUT_SECONDS):
-    return sdk_cmd.service_request('GET', service_name, path, timeout_seconds=timeout_seconds).json()
+    Args:
+        service_name: Jenkins instance
+        path: Path of the object, without '/api/json'
+        tree: Jenkins tree filter naming exactly the fields to return,
+            e.g. 'jobs[name,color]'; None returns every field
+        depth: How deep to expand nested objects when `tree` is None
+        timeout_seconds: Request timeout
+
+    Returns: The decoded JSON
+    """
+    return _get_jenkins_json(service_name, _get_jenkins_json_path(service_name, path),
+                             timeout_seconds, tree=tree, depth=depth)
+
+
+def _get_named_build(service_name, job_name, build_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=BUILD_TREE):
+    """Get a build through its permalink field, e.g. 'lastBuild', in a
+    single request. Returns None if the job has no such build, and
+    raises if the job does not exist.
+    """
+    path = _get_jenkins_json_path(service_name, 'job/{}'.format(job_name))
+    job_tree = '{}[{}]'.format(build_name, tree) if tree else build_name
+    job = _get_jenkins_json(service_name, path, timeout_seconds, tree=job_tree,
+                            depth=None if tree else 1)
+    return job[build_name]
+
+
+def _get_jenkins_root(service_name, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=None):
+    return _get_jenkins_json(service_name, 'api/json', timeout_seconds, tree=tree)
+
+
+def _get_jenkins_json(service_name, path, timeout_seconds=SHORT_TIMEOUT_SECONDS, tree=None, depth=None):
+    return sdk_cmd.service_request('GET', service_name, path,
+                                   timeout_seconds=timeout_seconds,
+                                   params=_get_jenkins_params(tree, depth)).json()
 
 
 def _get_jenkins_json_path(service_name, path):
     return '{}/api/json'.format(path)
 
 
+def _get_jenkins_params(tree, depth):
+    params = {}
+    if tree:
+        params['tree'] = tree
+    if depth is not None:
+        params['depth'] = depth
+    return params
+
+
 def _get_job_fixture(job_name):
     """Get the XML of the job fixture `job_name`. This should include
     the file suffix.
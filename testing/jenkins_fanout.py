@@ -0,0 +1,157 @@
+"""
+Query many Jenkins masters at once.
+
+The helpers in jenkins.py take a single service name and go through
+sdk_cmd, which opens a new connection and retries for each request.
+JenkinsFanout instead runs the same call against every master in a
+thread pool over one pooled HTTP session, with a per-master timeout,
+and yields each master's result as soon as it arrives:
+
+    with JenkinsFanout(masters) as fanout:
+        for result in fanout.get_last_build('generator-job'):
+            if result.error:
+                log.warning(...)
+"""
+import collections
+import logging
+import time
+from concurrent import futures
+
+import requests
+import requests.adapters
+import shakedown
+
+import jenkins
+import jenkins_remote_access
+import sdk_cmd
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_TIMEOUT_SECONDS = 10
+# Script console calls such as deleting every job take much longer
+DEFAULT_SCRIPT_TIMEOUT_SECONDS = 5 * 60
+
+# The outcome of one call on one master: `value` is the call's result,
+# or None if it raised `error`. `elapsed` is in seconds.
+FanoutResult = collections.namedtuple('FanoutResult', ['service_name', 'value', 'error', 'elapsed'])
+
+
+class JenkinsFanout:
+    """Runs Jenkins API calls concurrently against a list of masters.
+
+    Every call method returns an iterator of FanoutResult in completion
+    order. A master that errors or times out yields a result with
+    `error` set and does not stop the others.
+
+    `verify` defaults to the dcos CLI's core.ssl_verify setting, as
+    sdk_cmd requests do. `timeout_seconds` applies to API requests and
+    `script_timeout_seconds` to script console calls.
+    """
+
+    def __init__(self,
+                 service_names,
+                 max_workers=DEFAULT_MAX_WORKERS,
+                 timeout_seconds=DEFAULT_TIMEOUT_SECONDS,
+                 script_timeout_seconds=DEFAULT_SCRIPT_TIMEOUT_SECONDS,
+                 verify=None):
+        self.service_names = list(service_names)
+        self.max_workers = max_workers
+        self.timeout_seconds = timeout_seconds
+        self.script_timeout_seconds = script_timeout_seconds
+        if verify is None:
+            verify = _ssl_verify()
+
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        self._session.verify = verify
+        auth_token = sdk_cmd.run_cli('config show core.dcos_acs_token', print_output=False).strip()
+        self._session.headers['Authorization'] = 'token={}'.format(auth_token)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def get_jobs(self, tree=jenkins.JOBS_TREE):
+        return self.map(lambda service_name: self._get_json(service_name, 'api/json', tree)['jobs'])
+
+    def get_last_build(self, job_name, tree=jenkins.BUILD_TREE):
+        """Yields each master's last build of `job_name`, or None if the job
+        has no builds. A master without the job yields an HTTPError.
+        """
+        path = 'job/{}/api/json'.format(job_name)
+        job_tree = 'lastBuild[{}]'.format(tree)
+        return self.map(lambda service_name: self._get_json(service_name, path, job_tree)['lastBuild'])
+
+    def get_job_failures(self,
+                         offset=0,
+                         limit=jenkins_remote_access.JOB_FAILURES_PAGE_SIZE,
+                         tail_bytes=jenkins_remote_access.JOB_FAILURES_TAIL_BYTES,
+                         pattern=jenkins_remote_access.BUILD_FAILURE_STRING):
+        """Yields one page of each master's job failures, see
+        `jenkins_remote_access.get_job_failures`.
+        """
+        script = jenkins_remote_access._job_failures_script(offset, limit, tail_bytes, pattern)
+        return self.map(lambda service_name: jenkins_remote_access._parse_script_json(
+            self._run_script(service_name, script)))
+
+    def delete_all_jobs(self):
+        script = jenkins_remote_access.DELETE_ALL_JOBS
+        return self.map(lambda service_name: self._run_script(service_name, script).status_code)
+
+    def map(self, fn):
+        """Call fn(service_name) for every master concurrently and yield
+        a FanoutResult for each as it completes.
+        """
+        with futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {
+                executor.submit(_timed, fn, service_name): service_name
+                for service_name in self.service_names
+            }
+            for future in futures.as_completed(pending):
+                yield FanoutResult(pending[future], *future.result())
+
+    def _get_json(self, service_name, path, tree=None):
+        params = {'tree': tree} if tree else {}
+        r = self._session.get(self._url(service_name, path), params=params, timeout=self.timeout_seconds)
+        r.raise_for_status()
+        return r.json()
+
+    def _run_script(self, service_name, script):
+        r = self._session.post(self._url(service_name, 'scriptText'),
+                               data={'script': jenkins_remote_access.IMPORTS + script},
+                               timeout=self.script_timeout_seconds)
+        r.raise_for_status()
+        return r
+
+    def _url(self, service_name, path):
+        return shakedown.dcos_url_path('service/{}/{}'.format(service_name, path))
+
+
+def _ssl_verify():
+    """The dcos CLI's core.ssl_verify setting as a requests `verify`
+    argument: a bool, or the path to a CA bundle. Verifies when unset.
+    """
+    value = sdk_cmd.run_cli('config show core.ssl_verify', print_output=False).strip()
+    if value.lower() == 'false':
+        return False
+    if not value or value.lower() == 'true':
+        return True
+    return value
+
+
+def _timed(fn, service_name):
+    """Returns (value, error, elapsed) of fn(service_name)."""
+    start = time.time()
+    try:
+        return fn(service_name), None, time.time() - start
+    except Exception as e:
+        log.warning("Request to {} failed: {}".format(service_name, e))
+        return None, e, time.time() - start
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 
+import base64
+import json
 import logging
+from concurrent import futures
 from string import Template
 
 log = logging.getLogger(__name__)
@@ -12,6 +15,7 @@ import org.jenkinsci.plugins.mesos.MesosCloud;
 import org.jenkinsci.plugins.mesos.MesosSlaveInfo;
 import org.apache.mesos.Protos;
 import hudson.slaves.NodeProperty;
+import hudson.slaves.EnvironmentVariablesNodeProperty;
 import jenkins.model.*
 import org.jenkinsci.plugins.mesos.MesosSlaveInfo.URI;
 import hudson.tasks.*;
@@ -57,10 +61,20 @@ def mesosSlaveInfo = new MesosSlaveInfo(
         "$defaultSlave",
         $containerInfo,
         new LinkedList<URI>(),
-        new LinkedList<? extends NodeProperty<?>>()
+        nodeProperties
 )
 """
 
+WARM_POOL_NODE_PROPERTIES = """
+def nodeProperties = new LinkedList<NodeProperty<?>>()
+if ($warmPoolMin > 0) {
+    nodeProperties.add(new EnvironmentVariablesNodeProperty([
+            new EnvironmentVariablesNodeProperty.Entry("WARM_POOL_MIN", "$warmPoolMin"),
+            new EnvironmentVariablesNodeProperty.Entry("WARM_POOL_MAX", "$warmPoolMax"),
+    ]))
+}
+"""
+
 MESOS_SLAVE_INFO_ADD = """
 MesosCloud cloud = MesosCloud.get();
 cloud.getSlaveInfos().add(mesosSlaveInfo)
@@ -85,27 +99,200 @@ cloud.getSlaveInfos().each {
 }
 """
 
+APPLY_SLAVE_INFOS = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+
+def request = new JsonSlurper().parseText(new String("$payload".decodeBase64(), "UTF-8"))
+def result = [created: [], updated: [], unchanged: [], deleted: []]
+
+MesosCloud cloud = MesosCloud.get();
+def slaveInfos = cloud.getSlaveInfos()
+def findSlaveInfo = { label -> slaveInfos.find { it.getLabelString() == label } }
+
+def newSlaveInfo = { spec ->
+    def containerInfo = new MesosSlaveInfo.ContainerInfo(
+            "DOCKER",
+            spec.dockerImage,
+            true,
+            false,
+            false,
+            true,
+            "wrapper.sh",
+            new LinkedList<MesosSlaveInfo.Volume>(),
+            new LinkedList<MesosSlaveInfo.Parameter>(),
+            Protos.ContainerInfo.DockerInfo.Network.BRIDGE.name(),
+            new LinkedList<MesosSlaveInfo.PortMapping>(),
+            new LinkedList<MesosSlaveInfo.NetworkInfo>()
+    )
+    def nodeProperties = new LinkedList<NodeProperty<?>>()
+    if (spec.warmPoolMin > 0) {
+        nodeProperties.add(new EnvironmentVariablesNodeProperty([
+                new EnvironmentVariablesNodeProperty.Entry("WARM_POOL_MIN", spec.warmPoolMin as String),
+                new EnvironmentVariablesNodeProperty.Entry("WARM_POOL_MAX", spec.warmPoolMax as String),
+        ]))
+    }
+    return new MesosSlaveInfo(
+            spec.labelString,
+            Node.Mode.valueOf(spec.mode),
+            spec.slaveCpus,
+            spec.slaveMem,
+            spec.minExecutors,
+            spec.maxExecutors,
+            spec.executorCpus,
+            spec.diskNeeded,
+            spec.executorMem,
+            spec.remoteFSRoot,
+            spec.idleTerminationMinutes,
+            spec.slaveAttributes,
+            spec.jvmArgs,
+            spec.jnlpArgs,
+            spec.defaultSlave,
+            containerInfo,
+            new LinkedList<URI>(),
+            nodeProperties
+    )
+}
+
+request.upsert.each { spec ->
+    def slaveInfo = newSlaveInfo(spec)
+    def existing = findSlaveInfo(spec.labelString)
+    if (existing == null) {
+        slaveInfos.add(slaveInfo)
+        result.created << spec.labelString
+    } else if (Jenkins.XSTREAM2.toXML(existing) == Jenkins.XSTREAM2.toXML(slaveInfo)) {
+        result.unchanged << spec.labelString
+    } else {
+        slaveInfos.set(slaveInfos.indexOf(existing), slaveInfo)
+        result.updated << spec.labelString
+    }
+}
+
+request.delete.each { label ->
+    def existing = findSlaveInfo(label)
+    if (existing != null) {
+        slaveInfos.remove(existing)
+        result.deleted << label
+    }
+}
+
+if (result.created || result.updated || result.deleted) {
+    Jenkins.getInstance().save()
+}
+println(JsonOutput.toJson(result))
+"""
+
+CREATE_JOBS = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+import javax.xml.transform.stream.StreamSource
+
+def request = new JsonSlurper().parseText(new String("$payload".decodeBase64(), "UTF-8"))
+def result = [created: [], updated: []]
+
+request.jobs.each { name, xml ->
+    def job = Jenkins.getInstance().getItem(name)
+    if (job == null) {
+        job = Jenkins.getInstance().createProjectFromXML(name, new ByteArrayInputStream(xml.getBytes("UTF-8")))
+        result.created << name
+    } else {
+        job.updateByXml(new StreamSource(new ByteArrayInputStream(xml.getBytes("UTF-8"))))
+        result.updated << name
+    }
+    if (request.queue) {
+        job.scheduleBuild2(0)
+    }
+}
+
+println(JsonOutput.toJson(result))
+"""
+
 DELETE_ALL_JOBS = """
 Jenkins.instance.items.each { job -> job.delete() }
 """
 
+# Reads at most $tailBytes from the end of each failed build's log, so
+# large logs are never loaded whole into the master's heap.
 JENKINS_JOB_FAILURES = """
+import groovy.json.JsonOutput
+import groovy.json.JsonSlurper
+
+def request = new JsonSlurper().parseText(new String("$payload".decodeBase64(), "UTF-8"))
+
+def logTail = { run ->
+    def file = run.getLogFile()
+    if (!file.exists()) {
+        return []
+    }
+    def raf = new RandomAccessFile(file, "r")
+    try {
+        def start = Math.max(0L, raf.length() - request.tailBytes)
+        def bytes = new byte[(int) (raf.length() - start)]
+        raf.seek(start)
+        raf.readFully(bytes)
+        def lines = new String(bytes, "UTF-8").readLines()
+        // the first line of a partial read is cut off
+        return start > 0 ? lines.drop(1) : lines
+    } finally {
+        raf.close()
+    }
+}
+
 def activeJobs = hudson.model.Hudson.instance.items.findAll{job -> !(job instanceof Folder) && job.isBuildable()}
-println("successjobs = " +activeJobs.size())
-def failedRuns = activeJobs.findAll{job -> job.lastBuild != null && !(job.lastBuild.isBuilding()) && job.lastBuild.result == hudson.model.Result.FAILURE}
-println("failedjobs = " +failedRuns.size())
-BUILD_STRING = "Build step 'Execute shell' marked build as failure"
-
-failedRuns.each{ item ->
-    println "Failed Job Name: ${item.name}"
-    item.lastBuild.getLog().eachLine { line ->
-        if (line =~ /$BUILD_STRING/) {
-            println "error: $line"
-        }
+def page = activeJobs.drop(request.offset).take(request.limit)
+def failures = []
+page.each { job ->
+    def build = job.lastBuild
+    if (build == null || build.isBuilding() || build.result != hudson.model.Result.FAILURE) {
+        return
     }
+    failures << [
+        job: job.name,
+        build: build.number,
+        result: build.result.toString(),
+        duration: build.duration,
+        errors: logTail(build).findAll { it.contains(request.pattern) },
+    ]
 }
+
+def nextOffset = request.offset + page.size()
+println(JsonOutput.toJson([
+    activeJobs: activeJobs.size(),
+    offset: request.offset,
+    next: nextOffset < activeJobs.size() ? nextOffset : null,
+    failures: failures,
+]))
 """
 
+# Jobs per page of a job failure sweep
+JOB_FAILURES_PAGE_SIZE = 200
+# Bytes read from the end of each failed build's log
+JOB_FAILURES_TAIL_BYTES = 64 * 1024
+BUILD_FAILURE_STRING = "Build step 'Execute shell' marked build as failure"
+# Characters of a script logged by make_post(); bulk scripts embed
+# megabytes of base64 job configs
+LOGGED_SCRIPT_CHARS = 2000
+
+# Defaults for the settings of a bulk-applied MesosSlaveInfo; mode is
+# the name of a hudson.model.Node.Mode
+SLAVE_INFO_DEFAULTS = {
+    'dockerImage': 'mesosphere/jenkins-dind:0.7.0-ubuntu',
+    'slaveCpus': '0.1',
+    'slaveMem': '256',
+    'minExecutors': '1',
+    'maxExecutors': '1',
+    'executorCpus': '0.4',
+    'diskNeeded': '0.0',
+    'executorMem': '512',
+    'mode': 'NORMAL',
+    'remoteFSRoot': 'jenkins',
+    'idleTerminationMinutes': '5',
+    'slaveAttributes': '',
+    'jvmArgs': '-Xms16m -XX:+UseConcMarkSweepGC -Djava.net.preferIPv4Stack=true',
+    'jnlpArgs': '-noReconnect',
+    'defaultSlave': 'false',
+}
+
 CREDENTIAL_CHANGE = """
 import com.cloudbees.plugins.credentials.impl.UsernamePasswordCredentialsImpl
 
@@ -194,8 +381,15 @@ def add_slave_info(
         jvmArgs="-Xms16m -XX:+UseConcMarkSweepGC -Djava.net.preferIPv4Stack=true",
         jnlpArgs="-noReconnect",
         defaultSlave="false",
+        warmPoolMin=0,
+        warmPoolMax=0,
         **kwargs
 ):
+    """Add a Mesos agent template for `labelString`.
+
+    A positive `warmPoolMin` keeps that many idle agents provisioned
+    for the label, plus one per queued build up to `warmPoolMax`.
+    """
     slaveInfo = Template(MESOS_SLAVE_INFO_OBJECT).substitute({
          "labelString": labelString,
          "mode": mode,
@@ -219,8 +413,14 @@ def add_slave_info(
         "dockerImage": dockerImage,
     })
 
+    nodeProperties = Template(WARM_POOL_NODE_PROPERTIES).substitute({
+        "warmPoolMin": int(warmPoolMin),
+        "warmPoolMax": max(int(warmPoolMin), int(warmPoolMax)),
+    })
+
     return make_post(
         containerInfo +
+        nodeProperties +
         slaveInfo +
         MESOS_SLAVE_INFO_ADD,
         service_name,
@@ -228,6 +428,64 @@ def add_slave_info(
     )
 
 
+def apply_slave_infos(service_name, upserts=(), deletes=(), **kwargs):
+    """Create, update and delete Mesos agent templates on one master
+    with a single script. Each upsert is a dict of `add_slave_info`
+    arguments, with `labelString` required and the rest defaulting to
+    SLAVE_INFO_DEFAULTS. An existing template is only replaced when it
+    differs from its spec, so applying the same specs again is a no-op.
+
+    Returns: dict of 'created', 'updated', 'unchanged' and 'deleted'
+        label lists
+    """
+    payload = {
+        'upsert': [_slave_info_spec(**spec) for spec in upserts],
+        'delete': list(deletes),
+    }
+    r = make_post(
+        Template(APPLY_SLAVE_INFOS).substitute({'payload': _encode_payload(payload)}),
+        service_name,
+        **kwargs,
+    )
+    return _parse_script_json(r)
+
+
+def apply_slave_infos_on_masters(service_names, upserts=(), deletes=(), max_workers=16, **kwargs):
+    """Run `apply_slave_infos` with the same specs on several masters
+    concurrently. Masters that fail are logged and left out of the result.
+
+    Returns: dict of service name to its `apply_slave_infos` result
+    """
+    results = {}
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {
+            executor.submit(apply_slave_infos, service_name, upserts, deletes, **kwargs): service_name
+            for service_name in service_names
+        }
+        for future in futures.as_completed(pending):
+            service_name = pending[future]
+            try:
+                results[service_name] = future.result()
+            except Exception as e:
+                log.warning("Failed to apply slave infos on {}: {}".format(service_name, e))
+    return results
+
+
+def _slave_info_spec(labelString, warmPoolMin=0, warmPoolMax=0, **kwargs):
+    unknown = set(kwargs) - set(SLAVE_INFO_DEFAULTS)
+    if unknown:
+        raise ValueError("Unknown slave info settings: {}".format(', '.join(sorted(unknown))))
+
+    spec = dict(SLAVE_INFO_DEFAULTS, **kwargs)
+    spec = {key: str(value) for key, value in spec.items()}
+    spec.update({
+        'labelString': labelString,
+        'warmPoolMin': int(warmPoolMin),
+        'warmPoolMax': max(int(warmPoolMin), int(warmPoolMax)),
+    })
+    return spec
+
+
 def remove_slave_info(labelString, service_name):
     return make_post(
         Template(MESOS_SLAVE_INFO_REMOVE).substitute(
@@ -239,12 +497,74 @@ def remove_slave_info(labelString, service_name):
     )
 
 
+def create_jobs(service_name, jobs, queue=False, **kwargs):
+    """Create or update many jobs on one master with a single script.
+
+    Args:
+        jobs: dict of job name to config XML
+        queue: Queue a build of every job once it is saved
+
+    Returns: dict of 'created' and 'updated' job name lists
+    """
+    payload = {
+        'jobs': {name: xml.decode('utf-8') if isinstance(xml, bytes) else xml
+                 for name, xml in jobs.items()},
+        'queue': queue,
+    }
+    r = make_post(
+        Template(CREATE_JOBS).substitute({'payload': _encode_payload(payload)}),
+        service_name,
+        **kwargs,
+    )
+    return _parse_script_json(r)
+
+
 def delete_all_jobs(**kwargs):
     return make_post(DELETE_ALL_JOBS, **kwargs)
 
 
-def get_job_failures(service_name):
-    return make_post(JENKINS_JOB_FAILURES, service_name)
+def get_job_failures(service_name,
+                     offset=0,
+                     limit=JOB_FAILURES_PAGE_SIZE,
+                     tail_bytes=JOB_FAILURES_TAIL_BYTES,
+                     pattern=BUILD_FAILURE_STRING,
+                     **kwargs):
+    """Get the failed last builds of one page of `limit` buildable jobs,
+    starting at job `offset`. Only the last `tail_bytes` of each log are
+    searched for lines containing `pattern`.
+
+    The last line of the response is a JSON object with 'activeJobs',
+    'offset', 'next' (the offset of the next page, or null) and
+    'failures', a list of {job, build, result, duration, errors}.
+
+    :rtype: requests.Response
+    """
+    return make_post(
+        _job_failures_script(offset, limit, tail_bytes, pattern),
+        service_name,
+        **kwargs,
+    )
+
+
+def iter_job_failures(service_name, page_size=JOB_FAILURES_PAGE_SIZE, **kwargs):
+    """Yield the job failures of every page in turn, see `get_job_failures`."""
+    offset = 0
+    while offset is not None:
+        r = get_job_failures(service_name, offset=offset, limit=page_size, **kwargs)
+        r.raise_for_status()
+        page = _parse_script_json(r)
+        yield from page['failures']
+        offset = page['next']
+
+
+def _job_failures_script(offset, limit, tail_bytes, pattern):
+    payload = {
+        'offset': offset,
+        'limit': limit,
+        'tailBytes': tail_bytes,
+        'pattern': pattern,
+    }
+    return Template(JENKINS_JOB_FAILURES).substitute({'payload': _encode_payload(payload)})
 
 
 def change_mesos_creds(mesos_username, service_name):
@@ -267,6 +587,18 @@ def change_mesos_creds(mesos_username, service_name):
         service_name)
 
 
+def _encode_payload(payload):
+    """Encode script arguments so that no quoting or '$' in them can
+    break the Groovy source.
+    """
+    return base64.b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+
+
+def _parse_script_json(response):
+    """Parse the JSON a script prints as its last line."""
+    return json.loads(response.text.strip().splitlines()[-1])
+
+
 def make_post(
         post_body,
         service_name,
@@ -276,7 +608,12 @@ def make_post(
     :rtype: requests.Response
     """
     body = IMPORTS + post_body
-    log.info('\nMaking request : ========\n{}\n========\n'.format(body))
+    if len(post_body) > LOGGED_SCRIPT_CHARS:
+        logged = '{}\n... ({} more characters)'.format(post_body[:LOGGED_SCRIPT_CHARS],
+                                                   len(post_body) - LOGGED_SCRIPT_CHARS)
+    else:
+        logged = post_body
+    log.info('\nMaking request : ========\n{}\n========\n'.format(logged))
     '''
     Note: To run locally:
     curl -i -H "Authorization:token=$(dcos config show core.dcos_acs_token)" \
@@ -5,7 +5,10 @@ FOR THE TIME BEING WHATEVER MODIFICATIONS ARE APPLIED TO THIS FILE
 SHOULD ALSO BE APPLIED TO sdk_install IN ANY OTHER PARTNER REPOS
 ************************************************************************
 '''
+import base64
 import collections
+import functools
+import json
 import logging
 import time
 
@@ -26,16 +29,27 @@ import sdk_utils
 log = logging.getLogger(__name__)
 
 TIMEOUT_SECONDS = 15 * 60
+# How long the latest version of a package is reused before asking Cosmos again
+LATEST_VERSION_TTL_SECONDS = 60
 
 '''List of services which are currently installed via install().
 Used by post-test diagnostics to retrieve stuff from currently running services.'''
 _installed_service_names = set([])
 
+# package name -> (latest version, when it was resolved)
+_latest_versions = {}
+
 
 def get_package_json(package, version=None, options=None):
     """Get the Marathon app JSON for a given package with the desired
     options.
 
+    The package's Marathon template, config schema and resource are
+    fetched from Cosmos once per package and version, and the app is
+    rendered locally. Without a version, the latest one is looked up
+    again every LATEST_VERSION_TTL_SECONDS. Without pystache, every
+    call is rendered by Cosmos instead.
+
     Args:
         package: Package name
         version: Package version
@@ -44,10 +58,111 @@ def get_package_json(package, version=None, options=None):
     Returns: JSON
 
     """
+    opts = options if options else dict()
+    renderer = _get_package_renderer(package, _resolve_version(package, version))
+    if renderer is None:
+        pkg_version = dcos.packagemanager.CosmosPackageVersion(
+                package, version, dcos.cosmos.get_cosmos_url())
+        return pkg_version.marathon_json(opts)
+    return renderer.render(opts)
+
+
+class _PackageRenderer:
+    """Renders a package's Marathon app JSON the way Cosmos does: the
+    user options over the config schema defaults, plus the package
+    resource, into the Marathon mustache template.
+
+    Cosmos also adds package labels to the app. `labels` are those of
+    one reference render, added to every app, with DCOS_PACKAGE_OPTIONS
+    filled in per render.
+    """
+
+    def __init__(self, template, defaults, resource, labels):
+        import pystache
+
+        class _JsonRenderer(pystache.Renderer):
+            def str_coerce(self, val):
+                # true/false rather than Python's True/False
+                return json.dumps(val) if isinstance(val, bool) else str(val)
+
+        self._template = pystache.parse(template)
+        self._renderer = _JsonRenderer(escape=lambda u: json.dumps(u)[1:-1], missing_tags='ignore')
+        self._defaults = defaults
+        self._resource = resource
+        self._labels = labels
+
+    def render(self, options):
+        context = _merge_options(self._defaults, options)
+        context['resource'] = self._resource
+        app = json.loads(self._renderer.render(self._template, context))
+        labels = app.setdefault('labels', {})
+        for key, value in self._labels.items():
+            labels.setdefault(key, value)
+        if 'DCOS_PACKAGE_OPTIONS' in self._labels:
+            labels['DCOS_PACKAGE_OPTIONS'] = base64.b64encode(
+                json.dumps(options).encode('utf-8')).decode('utf-8')
+        return app
+
+
+@functools.lru_cache()
+def _get_package_renderer(package, version):
+    """A _PackageRenderer for the package, or None to render with Cosmos."""
+    try:
+        import pystache  # noqa: F401
+    except ImportError:
+        log.warning('pystache is not installed, rendering {} with Cosmos'.format(package))
+        return None
+
     pkg_version = dcos.packagemanager.CosmosPackageVersion(
             package, version, dcos.cosmos.get_cosmos_url())
-    opts = options if options else dict()
-    return pkg_version.marathon_json(opts)
+    template = pkg_version.marathon_template()
+    if isinstance(template, bytes):
+        template = template.decode('utf-8')
+    schema = pkg_version.config_json() or {}
+    resource = pkg_version.resource_json() or {}
+    try:
+        reference = pkg_version.marathon_json({})
+    except dcos.errors.DCOSException as e:
+        log.info('Cannot render {} with default options, rendering with Cosmos: {}'.format(package, e))
+        return None
+
+    # the template renders its own labels, which are kept
+    labels = {k: v for k, v in reference.get('labels', {}).items() if k.startswith('DCOS_PACKAGE_')}
+    return _PackageRenderer(template, _schema_defaults(schema), resource, labels)
+
+
+def _resolve_version(package, version):
+    """`version`, or the latest version of the package if it is None."""
+    if version is not None:
+        return version
+    latest, resolved_at = _latest_versions.get(package, (None, 0))
+    if time.time() - resolved_at > LATEST_VERSION_TTL_SECONDS:
+        latest = dcos.packagemanager.CosmosPackageVersion(
+                package, None, dcos.cosmos.get_cosmos_url()).version()
+        _latest_versions[package] = (latest, time.time())
+    return latest
+
+
+def _schema_defaults(schema):
+    """The default options of a package config JSON schema."""
+    defaults = {}
+    for name, prop in schema.get('properties', {}).items():
+        if 'default' in prop:
+            defaults[name] = prop['default']
+        elif prop.get('type') == 'object':
+            defaults[name] = _schema_defaults(prop)
+    return defaults
+
+
+def _merge_options(defaults, options):
+    """Deep merge of `options` over `defaults`."""
+    merged = dict(defaults)
+    for key, value in options.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge_options(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
 
 
 def get_installed_service_names() -> set:
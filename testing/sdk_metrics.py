@@ -7,8 +7,12 @@ FOR THE TIME BEING WHATEVER MODIFICATIONS ARE APPLIED TO THIS FILE
 SHOULD ALSO BE APPLIED TO sdk_metrics IN ANY OTHER PARTNER REPOS
 ************************************************************************
 '''
+import collections
 import json
 import logging
+import threading
+import time
+from concurrent import futures
 
 import retrying
 import shakedown
@@ -27,44 +31,113 @@ def get_scheduler_metrics(service_name, timeout_seconds=15*60):
 
 def get_scheduler_counter(service_name, counter_name, timeout_seconds=15*60):
     """Waits for and returns the specified counter value from the scheduler"""
-    @retrying.retry(
-        wait_fixed=1000,
-        stop_max_delay=timeout_seconds*1000,
-        retry_on_result=lambda res: not res)
-    def check_for_value():
-        try:
-            sched_metrics = get_scheduler_metrics(service_name)
-            if 'counters' not in sched_metrics:
-                log.info("No counters present for service {}. Types were: {}".format(
-                    service_name, sched_metrics.keys()))
-                return None
-            sched_counters = sched_metrics['counters']
-            if counter_name not in sched_counters:
-                log.info("No counter named '{}' was found for service {}. Counters were: {}".format(
-                    counter_name, service_name, sched_counters.keys()))
-                return None
-            value = sched_counters[counter_name]['count']
-            log.info("{} metric counter: {}={}".format(service_name, counter_name, value))
-            return value
-        except Exception as e:
-            log.error("Caught exception trying to get metrics: {}".format(e))
-            return None
-
-    return check_for_value()
+    with SchedulerMetricsWatcher(service_name) as watcher:
+        return watcher.wait_for_counter(counter_name, timeout_seconds=timeout_seconds)
 
 
 def wait_for_scheduler_counter_value(service_name, counter_name, min_value, timeout_seconds=15*60):
     """Waits for the specified counter value to be reached by the scheduler
     For example, check that `offers.processed` is equal or greater to 1."""
-    @retrying.retry(
-        wait_fixed=1000,
-        stop_max_delay=timeout_seconds*1000,
-        retry_on_result=lambda res: not res)
-    def check_for_value():
-        value = get_scheduler_counter(service_name, counter_name, timeout_seconds)
-        return value >= min_value
+    with SchedulerMetricsWatcher(service_name) as watcher:
+        return watcher.wait_for_counter(counter_name, min_value, timeout_seconds) >= min_value
+
+
+class SchedulerMetricsWatcher(object):
+    """Polls a scheduler's /v1/metrics endpoint from a single background thread
+    and resolves any number of counter waiters against the cached metrics tree.
 
-    return check_for_value()
+    Use as a context manager, or call start() and stop() explicitly:
+
+        with SchedulerMetricsWatcher('hello-world') as watcher:
+            watcher.wait_for_counter('offers.processed', 1, timeout_seconds=60)
+    """
+
+    def __init__(self, service_name, interval_seconds=1):
+        self.service_name = service_name
+        self.interval_seconds = interval_seconds
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._metrics = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(
+                target=self._poll,
+                name='metrics-{}'.format(self.service_name),
+                daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def metrics(self):
+        """The most recently fetched metrics tree, or None if no fetch has succeeded yet."""
+        with self._condition:
+            return self._metrics
+
+    def get_counter(self, counter_name):
+        """Returns the cached value of the counter, or None if it isn't present."""
+        return self._get_counter(self.metrics, counter_name)
+
+    def wait_for_counter(self, counter_name, min_value=None, timeout_seconds=15*60):
+        """Blocks until the counter is present (and at least `min_value`, if
+        provided) and returns its value. Raises TimeoutError once
+        `timeout_seconds` have elapsed without that happening."""
+        deadline = time.time() + timeout_seconds
+        with self._condition:
+            while True:
+                value = self._get_counter(self._metrics, counter_name)
+                if value is not None and (min_value is None or value >= min_value):
+                    return value
+                remaining = deadline - time.time()
+                if remaining <= 0 or self._stopped.is_set():
+                    raise TimeoutError("Counter '{}' for service {} did not reach {} within {}s (last value: {})".format(
+                        counter_name, self.service_name, min_value, timeout_seconds, value))
+                self._condition.wait(remaining)
+
+    def _poll(self):
+        while not self._stopped.is_set():
+            try:
+                # The watcher loop is the retry, so don't let a single fetch block on its own retries
+                metrics = sdk_cmd.service_request('GET', self.service_name, '/v1/metrics', retry=False).json()
+            except Exception as e:
+                log.error("Caught exception trying to get metrics: {}".format(e))
+            else:
+                with self._condition:
+                    self._metrics = metrics
+                    self._condition.notify_all()
+            self._stopped.wait(self.interval_seconds)
+
+    def _get_counter(self, sched_metrics, counter_name):
+        if sched_metrics is None:
+            return None
+        if 'counters' not in sched_metrics:
+            log.info("No counters present for service {}. Types were: {}".format(
+                self.service_name, sched_metrics.keys()))
+            return None
+        sched_counters = sched_metrics['counters']
+        if counter_name not in sched_counters:
+            log.info("No counter named '{}' was found for service {}. Counters were: {}".format(
+                counter_name, self.service_name, sched_counters.keys()))
+            return None
+        value = sched_counters[counter_name]['count']
+        log.info("{} metric counter: {}={}".format(self.service_name, counter_name, value))
+        return value
 
 
 def get_metrics(package_name, service_name, task_name):
@@ -74,53 +147,88 @@ def get_metrics(package_name, service_name, task_name):
     package_name -- the name of the package the service is using
     service_name -- the name of the service to get metrics for
     task_name -- the name of the task whose agent to run metrics commands from
-    """
-    tasks = shakedown.get_service_tasks(service_name)
-    for task in tasks:
-        if task['name'] == task_name:
-            task_to_check = task
 
-    if task_to_check is None:
-        raise Exception("Could not find task")
+    Returns an empty list if the task or its container is not found yet.
+    """
+    return get_metrics_batch(service_name, [task_name]).get(task_name, [])
 
-    agent_id = task_to_check['slave_id']
-    executor_id = task_to_check['executor_id']
 
-    pod_name = '-'.join(task_name.split("-")[:2])
-    pod_info = sdk_cmd.svc_cli(package_name, service_name, "pod info {}".format(pod_name), json=True)
-    task_info = None
-    for task in pod_info:
-        if task["info"]["name"] == task_name:
-            task_info = task
-            break
+def get_metrics_batch(service_name, task_names, max_workers=8):
+    """Return DC/OS metrics datapoints for several tasks of a service at once.
 
-    if not task_info:
-        return []
+    Tasks are grouped by the agent they run on so that each agent's
+    /metrics/v0/containers endpoint is queried only once, and the per-container
+    app metrics are then fetched concurrently. Container IDs are taken from the
+    Mesos task statuses, so no `pod info` CLI call is needed.
 
-    task_container_id = task_info["status"]["containerStatus"]["containerId"]["value"]
+    Keyword arguments:
+    service_name -- the name of the service to get metrics for
+    task_names -- the names of the tasks to fetch metrics for
+    max_workers -- the maximum number of concurrent metrics requests
 
-    # Not related to functionality but consuming this
-    # endpoint to verify downstream integrity
-    containers_response = sdk_cmd.cluster_request(
+    Returns a dict mapping each found task name to its list of datapoints. Tasks
+    which are not running, have no reported container, or whose container
+    metrics can't be matched to the task are logged and omitted.
+    """
+    wanted = set(task_names)
+    tasks_by_agent = collections.defaultdict(list)
+    for task in shakedown.get_service_tasks(service_name):
+        if task['name'] not in wanted:
+            continue
+        container_id = _get_task_container_id(task)
+        if not container_id:
+            log.info("No container ID reported yet for task {}".format(task['name']))
+            continue
+        tasks_by_agent[task['slave_id']].append((task, container_id))
+
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        reported = dict(zip(
+            tasks_by_agent.keys(),
+            executor.map(_get_agent_container_ids, tasks_by_agent.keys())))
+
+        pending = {}
+        for agent_id, agent_tasks in tasks_by_agent.items():
+            for task, container_id in agent_tasks:
+                # Not related to functionality but consuming this
+                # endpoint to verify downstream integrity
+                if container_id not in reported[agent_id]:
+                    log.warning("The metrics /container endpoint returned {}, expecting {} for task {} "
+                                "to be returned as well".format(reported[agent_id], container_id, task['name']))
+                    continue
+                pending[executor.submit(_get_container_app_metrics, agent_id, container_id)] = task
+
+        metrics = {}
+        for future in futures.as_completed(pending):
+            task = pending[future]
+            app_json = future.result()
+            if app_json['dimensions']['executor_id'] != task['executor_id']:
+                log.warning("No metrics found for task {}: container reported executor {}, expecting {}".format(
+                    task['name'], app_json['dimensions']['executor_id'], task['executor_id']))
+                continue
+            metrics[task['name']] = app_json['datapoints']
+
+    return metrics
+
+
+def _get_task_container_id(task):
+    """Returns the container ID from the most recent status of a Mesos task, or None"""
+    for status in reversed(task.get('statuses', [])):
+        container_id = status.get('container_status', {}).get('container_id', {}).get('value')
+        if container_id:
+            return container_id
+    return None
+
+
+def _get_agent_container_ids(agent_id):
+    response = sdk_cmd.cluster_request(
         "GET", "/system/v1/agent/{}/metrics/v0/containers".format(agent_id), retry=False)
-    reported_container_ids = json.loads(containers_response.text)
-
-    container_id_reported = False
-    for container_id in reported_container_ids:
-        if container_id == task_container_id:
-            container_id_reported = True
-
-    if not container_id_reported:
-        raise ValueError("The metrics /container endpoint returned {}, expecting {} to be returned as well".format(
-            reported_container_ids, task_container_id))
+    return set(json.loads(response.text))
 
-    app_response = sdk_cmd.cluster_request(
-        "GET", "/system/v1/agent/{}/metrics/v0/containers/{}/app".format(agent_id, task_container_id), retry=False)
-    app_json = json.loads(app_response.text)
-    if app_json['dimensions']['executor_id'] == executor_id:
-        return app_json['datapoints']
 
-    raise Exception("No metrics found")
+def _get_container_app_metrics(agent_id, container_id):
+    response = sdk_cmd.cluster_request(
+        "GET", "/system/v1/agent/{}/metrics/v0/containers/{}/app".format(agent_id, container_id), retry=False)
+    return json.loads(response.text)
 
 
 def check_metrics_presence(emitted_metrics, expected_metrics):
@@ -0,0 +1,145 @@
+"""
+Keep a scale run under a Mesos role's CPU quota.
+
+With a quota on the agents' role, Jenkins agents beyond it sit pending
+in Mesos until their builds time out, so a run measures the timeouts
+rather than the throughput at the quota. AdmissionController gates new
+work on the role's allocation instead: admit() blocks until the CPUs
+allocated to the role, plus those admitted but not allocated yet, stay
+under `target` of the quota, and records how long callers were held.
+
+Allocation comes from /mesos/roles and the quota from /mesos/quota,
+polled at most every `poll_seconds` by all callers together. Admitted
+CPUs are counted as pending for `settle_seconds`, which should cover
+the time an agent takes to show up in the role's allocation.
+"""
+
+import logging
+import threading
+import time
+
+import sdk_cmd
+
+log = logging.getLogger(__name__)
+
+
+class AdmissionController:
+    """Throttles work that allocates CPUs in `role` to stay under
+    `target` (a fraction) of the role's CPU quota. Without a quota on
+    the role, everything is admitted at once.
+
+    Safe to share between threads.
+    """
+
+    def __init__(self,
+                 role,
+                 target=0.9,
+                 poll_seconds=5,
+                 settle_seconds=60,
+                 max_wait_seconds=10 * 60):
+        self.role = role
+        self.target = target
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.admitted = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.overrides = 0
+        self.peak_utilization = 0.0
+        self._quota = None
+        self._allocated = 0.0
+        self._polled_at = 0.0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def admit(self, cpus=0.0):
+        """Block until `cpus` more can be allocated to the role without
+        going over the target, then count them as pending. With no
+        `cpus`, this waits for the role to drop under the target.
+
+        Work is admitted anyway, with a warning, after
+        `max_wait_seconds`, or when nothing is allocated or pending
+        but `cpus` alone is over the target.
+        """
+        start = time.time()
+        held = False
+        while True:
+            with self._lock:
+                now = time.time()
+                usage = self._usage(now)
+                limit = None if self._quota is None else self._quota * self.target
+                waited = now - start
+                fits = limit is None or usage + cpus <= limit or usage == 0
+                if fits or waited >= self.max_wait_seconds:
+                    if not fits:
+                        log.warning("Admitting {} CPUs in role {} over the target after {:.0f}s "
+                                    "({:.1f} of {:.1f} CPUs in use).".format(
+                                        cpus, self.role, waited, usage, limit))
+                        self.overrides += 1
+                    if held:
+                        self.throttled += 1
+                        self.throttled_seconds += waited
+                    self.admitted += 1
+                    if cpus:
+                        self._pending.append((now, cpus))
+                    return waited if held else 0.0
+            held = True
+            time.sleep(self.poll_seconds)
+
+    def utilization(self):
+        """Returns the role's allocated plus pending CPUs as a fraction of
+        its quota, or None if the role has no CPU quota.
+        """
+        with self._lock:
+            usage = self._usage(time.time())
+            return None if self._quota is None else usage / self._quota
+
+    def summary(self):
+        with self._lock:
+            return {
+                'role': self.role,
+                'quota': self._quota,
+                'target': self.target,
+                'admitted': self.admitted,
+                'throttled': self.throttled,
+                'throttled_seconds': self.throttled_seconds,
+                'overrides': self.overrides,
+                'peak_utilization': self.peak_utilization,
+            }
+
+    def _usage(self, now):
+        """Allocated plus pending CPUs; polls Mesos if the last poll is
+        older than `poll_seconds`. Must be called holding the lock.
+        """
+        if now - self._polled_at >= self.poll_seconds:
+            self._quota = get_cpu_quota(self.role)
+            self._allocated = get_allocated_cpus(self.role)
+            self._polled_at = now
+        self._pending = [(t, cpus) for t, cpus in self._pending if now - t < self.settle_seconds]
+        usage = self._allocated + sum(cpus for _, cpus in self._pending)
+        if self._quota:
+            self.peak_utilization = max(self.peak_utilization, self._allocated / self._quota)
+        return usage
+
+
+def get_cpu_quota(role):
+    """Returns the CPU quota guaranteed to `role`, or None if it has none."""
+    quotas = sdk_cmd.cluster_request('GET', '/mesos/quota').json()
+    for info in quotas.get('infos', []):
+        if info['role'] != role:
+            continue
+        for guarantee in info.get('guarantee', []):
+            if guarantee['name'] == 'cpus':
+                return guarantee['scalar']['value']
+    return None
+
+
+def get_allocated_cpus(role):
+    """Returns the CPUs currently allocated to `role`."""
+    roles = sdk_cmd.cluster_request('GET', '/mesos/roles').json()
+    for info in roles.get('roles', []):
+        if info['name'] == role:
+            # 'allocated' is only reported by newer Mesos versions
+            return info.get('allocated', info.get('resources', {})).get('cpus', 0.0)
+    return 0.0
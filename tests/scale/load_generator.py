@@ -0,0 +1,207 @@
+"""
+An open-loop build load generator for Jenkins masters.
+
+Builds are triggered at arrival times drawn from an arrival model,
+independently of how quickly earlier builds complete, so a master that
+falls behind shows up as growing latencies rather than as a lower
+trigger rate. Each trigger is followed to completion with a
+jenkins.BuildTracker, and its latencies are measured on the master's
+own clock:
+
+    * trigger-to-start: from entering the queue until the build starts
+    * trigger-to-finish: from entering the queue until the build ends
+
+Both are unknown, and left out of the percentiles, for a build whose
+queue item Jenkins dropped before its tracker saw it leave the queue.
+
+Supported arrival models (ARRIVAL_MODELS):
+    * poisson: exponential gaps at a constant mean rate
+    * burst: bursts of `burst_size` triggers at once, at the mean rate
+    * diurnal: a Poisson process whose rate follows a sine wave with
+        period `period_seconds`, between (1 - amplitude) and
+        (1 + amplitude) times the mean rate
+
+With an admission.AdmissionController, each trigger first waits for
+`build_cpus` of room under the quota target, so the arrival schedule
+slips while the agent role is at its quota rather than queueing builds
+that cannot get an agent.
+"""
+
+import collections
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent import futures
+
+import jenkins
+
+log = logging.getLogger(__name__)
+
+# Job parameter that makes every trigger a distinct queue item
+TRIGGER_PARAMETER = 'TRIGGER_ID'
+
+BuildRecord = collections.namedtuple(
+    'BuildRecord', ['service_name', 'number', 'result', 'trigger_to_start', 'trigger_to_finish'])
+
+
+def poisson_arrivals(rate_per_minute, duration_seconds, rng=random):
+    """Yield arrival offsets, in seconds, of a Poisson process."""
+    t = rng.expovariate(rate_per_minute / 60.0)
+    while t < duration_seconds:
+        yield t
+        t += rng.expovariate(rate_per_minute / 60.0)
+
+
+def burst_arrivals(rate_per_minute, duration_seconds, rng=random, burst_size=10):
+    """Yield arrival offsets of bursts of `burst_size` simultaneous triggers."""
+    for t in poisson_arrivals(rate_per_minute / burst_size, duration_seconds, rng):
+        for _ in range(burst_size):
+            yield t
+
+
+def diurnal_arrivals(rate_per_minute, duration_seconds, rng=random, period_seconds=3600, amplitude=0.8):
+    """Yield arrival offsets of a Poisson process with a sinusoidal rate,
+    by thinning a process at the peak rate.
+    """
+    peak = rate_per_minute * (1 + amplitude)
+    for t in poisson_arrivals(peak, duration_seconds, rng):
+        rate = rate_per_minute * (1 + amplitude * math.sin(2 * math.pi * t / period_seconds))
+        if rng.random() < rate / peak:
+            yield t
+
+
+ARRIVAL_MODELS = {
+    'poisson': poisson_arrivals,
+    'burst': burst_arrivals,
+    'diurnal': diurnal_arrivals,
+}
+
+
+class LoadGenerator:
+    """Triggers builds of `job_name` across `service_names` at
+    `rate_per_minute` (for the whole cluster) for `duration_seconds`.
+
+    The job must take the TRIGGER_PARAMETER string parameter and allow
+    concurrent builds, see jenkins.construct_job_config().
+    """
+
+    def __init__(self,
+                 service_names,
+                 job_name,
+                 rate_per_minute,
+                 duration_seconds,
+                 model='poisson',
+                 max_workers=64,
+                 max_tracked=512,
+                 build_timeout_seconds=30 * 60,
+                 seed=None,
+                 controller=None,
+                 build_cpus=0.0,
+                 **model_args):
+        if model not in ARRIVAL_MODELS:
+            raise ValueError("Unknown arrival model '{}', expected one of: {}".format(
+                model, ', '.join(sorted(ARRIVAL_MODELS))))
+        self.service_names = list(service_names)
+        self.job_name = job_name
+        self.rate_per_minute = rate_per_minute
+        self.duration_seconds = duration_seconds
+        self.model = model
+        self.model_args = model_args
+        self.max_workers = max_workers
+        self.max_tracked = max_tracked
+        self.build_timeout_seconds = build_timeout_seconds
+        self.controller = controller
+        self.build_cpus = build_cpus
+        self.records = []
+        self.failures = collections.Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Trigger builds until the duration has passed, then wait for
+        all of them to finish. Returns the summary().
+        """
+        arrivals = ARRIVAL_MODELS[self.model](
+            self.rate_per_minute, self.duration_seconds, self._rng, **self.model_args)
+        start = time.time()
+        # Triggers go through their own pool so that builds still being
+        # tracked never hold back the next arrival.
+        with futures.ThreadPoolExecutor(max_workers=self.max_tracked) as trackers:
+            with futures.ThreadPoolExecutor(max_workers=self.max_workers) as triggers:
+                for offset in arrivals:
+                    delay = start + offset - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                    if self.controller:
+                        self.controller.admit(self.build_cpus)
+                    triggers.submit(self._trigger, self._rng.choice(self.service_names), trackers)
+        return self.summary()
+
+    def summary(self):
+        """Returns throughput and latency statistics of the finished builds."""
+        minutes = self.duration_seconds / 60.0
+        per_master = collections.Counter(r.service_name for r in self.records)
+        return {
+            'model': self.model,
+            'target_rate_per_minute': self.rate_per_minute,
+            'builds': len(self.records),
+            'failures': dict(self.failures),
+            'builds_per_minute': len(self.records) / minutes,
+            'builds_per_minute_per_master': {
+                name: per_master[name] / minutes for name in self.service_names
+            },
+            'unknown_queue_time': sum(1 for r in self.records if r.trigger_to_start is None),
+            'trigger_to_start': _percentiles([r.trigger_to_start for r in self.records
+                                              if r.trigger_to_start is not None]),
+            'trigger_to_finish': _percentiles([r.trigger_to_finish for r in self.records
+                                               if r.trigger_to_finish is not None]),
+        }
+
+    def _trigger(self, service_name, trackers):
+        try:
+            queue_id = jenkins.trigger_build(service_name,
+                                             self.job_name,
+                                             **{TRIGGER_PARAMETER: uuid.uuid4().hex})
+        except Exception as e:
+            self._record_failure(service_name, e)
+            return
+        trackers.submit(self._track, service_name, queue_id)
+
+    def _track(self, service_name, queue_id):
+        tracker = jenkins.BuildTracker(service_name, self.job_name, queue_id)
+        try:
+            build = tracker.wait_for_build(timeout_seconds=self.build_timeout_seconds)
+        except Exception as e:
+            self._record_failure(service_name, e)
+            return
+
+        queued_at = tracker.queued_at
+        if queued_at is None:
+            log.info("Queue time of build {} of {} on {} is unknown".format(
+                build['number'], self.job_name, service_name))
+        record = BuildRecord(service_name,
+                             build['number'],
+                             build['result'],
+                             None if queued_at is None else (build['timestamp'] - queued_at) / 1000,
+                             None if queued_at is None else
+                             (build['timestamp'] + build['duration'] - queued_at) / 1000)
+        with self._lock:
+            self.records.append(record)
+
+    def _record_failure(self, service_name, e):
+        log.warning("Build of {} on {} failed: {}".format(self.job_name, service_name, e))
+        with self._lock:
+            self.failures[type(e).__name__] += 1
+
+
+def _percentiles(values, points=(50, 90, 99)):
+    """Returns the given percentiles and the max of `values`, in seconds."""
+    if not values:
+        return {}
+    values = sorted(values)
+    result = {'p{}'.format(p): values[min(len(values) - 1, int(len(values) * p / 100))] for p in points}
+    result['max'] = values[-1]
+    return result
@@ -0,0 +1,145 @@
+"""
+Plan how many Jenkins masters a cluster can hold before a scale run.
+
+Masters are added with fixed resources, and every master brings up
+agents for its jobs, so a run that asks for more than the cluster can
+hold stalls in Marathon until DEPLOY_TIMEOUT. plan_masters() packs the
+requested masters, each with its agents, onto the Mesos agents' free
+resources and caps the result by the agent role's CPU quota.
+
+Capacity comes from /mesos/slaves, current usage from
+/mesos/state-summary. Resources reserved for other roles are not
+counted as free.
+"""
+
+import collections
+import logging
+
+import jenkins
+import sdk_cmd
+import sdk_install
+
+log = logging.getLogger(__name__)
+
+# Resources of one Jenkins master or one agent; disk is in MB
+Resources = collections.namedtuple('Resources', ['cpus', 'mem', 'disk'])
+
+Plan = collections.namedtuple('Plan', [
+    'requested',       # number of masters asked for
+    'feasible',        # number of masters, with agents, that fit
+    'limited_by',      # 'requested', 'capacity' or 'quota'
+    'nodes',           # number of active Mesos agents
+    'hostnames',       # agent hostname for each feasible master, in order
+])
+
+
+def master_resources(package_name='jenkins'):
+    """The resources of a master as installed by jenkins.install(),
+    from the rendered package defaults.
+    """
+    pkg_json = sdk_install.get_package_json(package_name, None, {
+        "service": {"name": "planner"},
+        "storage": {"local-persistent-volume-size": jenkins.LOCAL_VOLUME_SIZE_MB},
+    })
+    return Resources(float(pkg_json['cpus']), float(pkg_json['mem']), float(jenkins.LOCAL_VOLUME_SIZE_MB))
+
+
+def get_free_resources(role='*'):
+    """Returns a dict of active agent hostname to its free Resources.
+    Resources reserved for roles other than '*' and `role` are excluded.
+    """
+    slaves = sdk_cmd.cluster_request('GET', '/mesos/slaves').json()['slaves']
+    summary = sdk_cmd.cluster_request('GET', '/mesos/state-summary').json()['slaves']
+    used = {s['id']: s.get('used_resources', {}) for s in summary}
+
+    free = {}
+    for slave in slaves:
+        if not slave.get('active', True):
+            continue
+        reserved = Resources(0, 0, 0)
+        for reserved_role, resources in slave.get('reserved_resources', {}).items():
+            if reserved_role not in ('*', role):
+                reserved = _add(reserved, _resources(resources))
+        usage = _resources(used.get(slave['id'], slave.get('used_resources', {})))
+        free[slave['hostname']] = _subtract(_subtract(_resources(slave['resources']), reserved), usage)
+    return free
+
+
+def plan_masters(requested, master, agent, agents_per_master, free, cpu_quota=0.0):
+    """Work out how many of `requested` masters fit on the cluster.
+
+    Each master is placed on the agent with the most free CPUs, which
+    spreads masters evenly, and its agents are placed the same way. A
+    master only counts if it and all its agents fit.
+
+    Args:
+        requested: Number of masters wanted
+        master: Resources of one master
+        agent: Resources of one Jenkins agent
+        agents_per_master: Agents each master runs at once
+        free: Free Resources per hostname, see get_free_resources()
+        cpu_quota: CPU quota of the agents' role; 0.0 for no quota
+
+    Returns: a Plan
+    """
+    free = dict(free)
+    hostnames = []
+    limited_by = 'requested'
+
+    quota_limit = requested
+    if cpu_quota > 0 and agents_per_master > 0 and agent.cpus > 0:
+        # in thousandths, so float error can't floor a quota that fits exactly
+        quota_limit = _milli(cpu_quota) // _milli(agents_per_master * agent.cpus)
+
+    for _ in range(requested):
+        if len(hostnames) >= quota_limit:
+            limited_by = 'quota'
+            break
+        placed = dict(free)
+        host = _place(placed, master)
+        if host is None or any(_place(placed, agent) is None for _ in range(agents_per_master)):
+            limited_by = 'capacity'
+            break
+        free = placed
+        hostnames.append(host)
+
+    return Plan(requested, len(hostnames), limited_by, len(free), hostnames)
+
+
+def log_plan(plan):
+    log.info("Planned {} of {} requested masters on {} agents (limited by {})".format(
+        plan.feasible, plan.requested, plan.nodes, plan.limited_by))
+    for hostname, count in sorted(collections.Counter(plan.hostnames).items()):
+        log.info("  {}: {} master(s)".format(hostname, count))
+
+
+def _place(free, item):
+    """Take `item` from the host in `free` with the most free CPUs that
+    can hold it, and return that host, or None if none can.
+    """
+    fits = [host for host, resources in free.items()
+            if all(_milli(have) >= _milli(need) for have, need in zip(resources, item))]
+    if not fits:
+        return None
+    host = max(fits, key=lambda h: free[h].cpus)
+    free[host] = _subtract(free[host], item)
+    return host
+
+
+def _milli(value):
+    """`value` in thousandths, the precision Mesos keeps for scalar
+    resources.
+    """
+    return int(round(value * 1000))
+
+
+def _resources(json):
+    return Resources(json.get('cpus', 0.0), json.get('mem', 0.0), json.get('disk', 0.0))
+
+
+def _add(a, b):
+    return Resources(*(x + y for x, y in zip(a, b)))
+
+
+def _subtract(a, b):
+    return Resources(*(max(0.0, x - y) for x, y in zip(a, b)))
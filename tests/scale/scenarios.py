@@ -0,0 +1,255 @@
+"""
+Workload scenarios for the scale harness.
+
+Each Scenario declares the job it generates, the agent resources its
+builds need, how long a build is expected to take and how to tell
+whether a build succeeded. Scenarios are registered by name in
+SCENARIOS, and the harness mixes them by weight with a spec such as
+"sleep:3,cpu:1,pipeline:1" (see parse_mix()).
+
+Job configs are generated from a JobSettings, which carries the
+settings the harness applies to every job:
+    * duration: seconds of work for a build
+    * run_delay: run every X minutes
+    * label: agent label the scenario's jobs run on
+    * cron_style: 'fixed' or 'hashed', see jenkins.cron_spec()
+    * jitter: random quiet period, in seconds
+    * single_use: run on a Mesos single-use agent
+    * cpus: whole CPUs of the scenario's executor, at least 1
+"""
+
+import collections
+import random
+from xml.etree import ElementTree
+
+import jenkins
+import jenkins_remote_access
+
+JobSettings = collections.namedtuple(
+    'JobSettings', ['duration', 'run_delay', 'label', 'cron_style', 'jitter', 'single_use', 'cpus'])
+
+SINGLE_USE_WRAPPER = 'org.jenkinsci.plugins.mesos.MesosSingleUseSlave'
+
+SCENARIOS = {}
+
+
+class Scenario:
+    """A workload the scale harness can generate jobs for.
+
+    Args:
+        name: Name of the scenario, as given to --scenario
+        job_config: Callable taking a JobSettings and returning job config XML
+        executor_cpus: CPU shares of each executor that runs the scenario
+        executor_mem: Memory, in MB, of each executor that runs the scenario
+        expected_duration: Callable taking the work duration and returning
+            the expected build duration, in seconds
+        success: Callable taking the build JSON and returning whether
+            the build succeeded
+    """
+
+    def __init__(self,
+                 name,
+                 job_config,
+                 executor_cpus,
+                 executor_mem,
+                 expected_duration,
+                 success=None):
+        self.name = name
+        self.job_config = job_config
+        self.executor_cpus = executor_cpus
+        self.executor_mem = executor_mem
+        self.expected_duration = expected_duration
+        self.success = success or _succeeded
+
+    @property
+    def whole_cpus(self):
+        """The executor's CPU shares as a whole number of CPUs, at least 1."""
+        return max(1, int(self.executor_cpus))
+
+    @property
+    def label(self):
+        return 'scale-{}'.format(self.name)
+
+    def slave_info(self, docker_image):
+        """The Mesos agent template spec for this scenario's label, for
+        jenkins_remote_access.apply_slave_infos().
+        """
+        return {
+            'labelString': self.label,
+            'dockerImage': docker_image,
+            'executorCpus': self.executor_cpus,
+            'executorMem': self.executor_mem,
+            'idleTerminationMinutes': 1,
+        }
+
+    def agent_resources(self):
+        """The (cpus, mem) of one agent of this scenario's label, with
+        one executor.
+        """
+        defaults = jenkins_remote_access.SLAVE_INFO_DEFAULTS
+        return (float(defaults['slaveCpus']) + self.executor_cpus,
+                float(defaults['slaveMem']) + self.executor_mem)
+
+
+def register(scenario):
+    SCENARIOS[scenario.name] = scenario
+    return scenario
+
+
+def parse_mix(spec):
+    """Parse a "name[:weight],..." spec into a list of (Scenario, weight).
+    Weights default to 1 and must be greater than 0.
+    """
+    mix = []
+    for entry in spec.split(','):
+        name, _, weight = entry.strip().partition(':')
+        if name not in SCENARIOS:
+            raise ValueError("Unknown scenario '{}', expected one of: {}".format(
+                name, ', '.join(sorted(SCENARIOS))))
+        try:
+            weight = float(weight or 1)
+        except ValueError:
+            weight = None
+        if weight is None or not 0 < weight < float('inf'):
+            raise ValueError("Invalid weight in '{}', expected a number greater than 0".format(entry.strip()))
+        mix.append((SCENARIOS[name], weight))
+    return mix
+
+
+def assign(mix, count):
+    """Split `count` jobs between the scenarios of `mix` in proportion
+    to their weights, rounding by largest remainder.
+
+    Returns: list of `count` Scenarios, one per job
+    """
+    total = sum(weight for _, weight in mix)
+    shares = [(scenario, count * weight / total) for scenario, weight in mix]
+    counts = [int(share) for _, share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: shares[i][1] - counts[i], reverse=True)
+    for i in by_remainder[:count - sum(counts)]:
+        counts[i] += 1
+    return [scenario for (scenario, _), n in zip(shares, counts) for _ in range(n)]
+
+
+def _succeeded(build):
+    return build is not None and build.get('result') == 'SUCCESS'
+
+
+def _archived_artifacts(build):
+    return _succeeded(build) and bool(build.get('artifacts'))
+
+
+def _shell_job(command, archive=None):
+    """Job config factory for a freestyle job running `command`, which is
+    formatted with the JobSettings fields. `archive` is an Ant pattern of
+    files to archive when the build ends.
+    """
+    def job_config(settings):
+        xml = jenkins.construct_job_config(command.format(**settings._asdict()),
+                                           settings.run_delay,
+                                           settings.label,
+                                           cron_style=settings.cron_style,
+                                           jitter_seconds=settings.jitter)
+        root = ElementTree.fromstring(xml)
+        if not settings.single_use:
+            wrappers = root.find('./buildWrappers')
+            for wrapper in wrappers.findall(SINGLE_USE_WRAPPER):
+                wrappers.remove(wrapper)
+        if archive:
+            archiver = ElementTree.SubElement(root.find('./publishers'), 'hudson.tasks.ArtifactArchiver')
+            ElementTree.SubElement(archiver, 'artifacts').text = archive
+            ElementTree.SubElement(archiver, 'fingerprint').text = 'true'
+        return ElementTree.tostring(root, encoding='utf8', method='xml')
+    return job_config
+
+
+def _pipeline_job(script):
+    """Job config factory for a Pipeline job running `script`, which is
+    formatted with the JobSettings fields. Single-use agents are not
+    applied to Pipeline jobs.
+    """
+    def job_config(settings):
+        root = ElementTree.Element('flow-definition')
+        ElementTree.SubElement(root, 'description').text = 'created from tests'
+        ElementTree.SubElement(root, 'keepDependencies').text = 'false'
+        properties = ElementTree.SubElement(root, 'properties')
+        if settings.run_delay is not None:
+            triggers = ElementTree.SubElement(
+                ElementTree.SubElement(properties,
+                                       'org.jenkinsci.plugins.workflow.job.properties.PipelineTriggersJobProperty'),
+                'triggers')
+            timer = ElementTree.SubElement(triggers, 'hudson.triggers.TimerTrigger')
+            ElementTree.SubElement(timer, 'spec').text = jenkins.cron_spec(settings.run_delay, settings.cron_style)
+        definition = ElementTree.SubElement(root, 'definition',
+                                            {'class': 'org.jenkinsci.plugins.workflow.cps.CpsFlowDefinition'})
+        ElementTree.SubElement(definition, 'script').text = script.format(**settings._asdict())
+        ElementTree.SubElement(definition, 'sandbox').text = 'true'
+        if settings.jitter:
+            ElementTree.SubElement(root, 'quietPeriod').text = str(random.randint(0, settings.jitter))
+        ElementTree.SubElement(root, 'disabled').text = 'false'
+        return ElementTree.tostring(root, encoding='utf8', method='xml')
+    return job_config
+
+
+register(Scenario(
+    'sleep',
+    _shell_job("echo 'hello, world'; sleep {duration}"),
+    executor_cpus=0.3,
+    executor_mem=1800,
+    expected_duration=lambda duration: duration))
+
+register(Scenario(
+    'buildmarathon',
+    _shell_job('git clone --depth 1 --branch v1.6.352 https://github.com/mesosphere/marathon.git; '
+               'cd marathon; '
+               'export SBT_OPTS="-Xmx750M -Xms750M -XX:+UseConcMarkSweepGC -XX:+CMSClassUnloadingEnabled -Xss2M"; '
+               'curl -LO https://piccolo.link/sbt-1.1.2.tgz; tar -zxf sbt*.tgz; sbt/bin/sbt compile'),
+    executor_cpus=0.3,
+    executor_mem=1800,
+    expected_duration=lambda duration: 20 * 60))
+
+register(Scenario(
+    'cpu',
+    _shell_job("for i in $(seq {cpus}); do timeout {duration} sh -c 'while :; do :; done' & done; wait"),
+    executor_cpus=1.0,
+    executor_mem=512,
+    expected_duration=lambda duration: duration))
+
+register(Scenario(
+    'io',
+    _shell_job("timeout {duration} sh -c 'while :; do "
+               "dd if=/dev/zero of=io.dat bs=1M count=256 conv=fsync 2>/dev/null; "
+               "dd if=io.dat of=/dev/null bs=1M 2>/dev/null; done' || true; rm -f io.dat"),
+    executor_cpus=0.5,
+    executor_mem=1024,
+    expected_duration=lambda duration: duration))
+
+register(Scenario(
+    'docker-build',
+    _shell_job('printf "FROM alpine:3.7\\nRUN head -c 64m /dev/urandom > /blob\\n" > Dockerfile; '
+               'docker build --no-cache -t scale-test-$BUILD_NUMBER .; '
+               'docker rmi scale-test-$BUILD_NUMBER'),
+    executor_cpus=1.0,
+    executor_mem=2048,
+    expected_duration=lambda duration: 2 * 60))
+
+register(Scenario(
+    'pipeline',
+    _pipeline_job("def branches = [:]\n"
+                  "for (int i = 0; i < 3; i++) {{\n"
+                  "    branches['branch-' + i] = {{ node('{label}') {{ sh 'sleep {duration}' }} }}\n"
+                  "}}\n"
+                  "stage('parallel') {{ parallel branches }}\n"),
+    executor_cpus=0.3,
+    executor_mem=512,
+    expected_duration=lambda duration: duration))
+
+register(Scenario(
+    'artifact',
+    _shell_job('mkdir -p out; for i in $(seq 10); do head -c 10m /dev/urandom > out/blob-$i; done; '
+               'sleep {duration}',
+               archive='out/**'),
+    executor_cpus=0.2,
+    executor_mem=512,
+    expected_duration=lambda duration: duration,
+    success=_archived_artifacts))
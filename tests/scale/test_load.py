@@ -7,6 +7,10 @@ To specify a CPU quota (what JPMC does) then run:
     $ PYTEST_ARGS="--masters=3 --jobs=10 --cpu-quota=10.0" ./test.sh -m scale jenkins
 To enable single use:
     $ PYTEST_ARGS="--masters=3 --jobs=10 --single-use" ./test.sh -m scale jenkins
+To measure sustained build throughput under an open-loop arrival model:
+    $ PYTEST_ARGS="--masters=3 --arrival-model=poisson --arrival-rate=30 --work-duration=60 -k test_build_throughput" ./test.sh -m scale jenkins
+To compare build queue times with and without a warm agent pool:
+    $ PYTEST_ARGS="--jobs=10 --warm-pool=2 -k test_warm_pool_queue_wait" ./test.sh -m scale jenkins
 And to clean-up a test run of Jenkins instances:
     $ ./test.sh -m scalecleanup jenkins
 
@@ -17,27 +21,60 @@ This supports the following configuration params:
         on each instance.
     * How often, in minutes, to run a job (--run-delay); this is used
         to create a cron schedule: "*/run-delay * * * *"
+    * Whether jobs all run at the same minute of that schedule
+        (--cron-style=fixed) or are spread over it by job name
+        (--cron-style=hashed, "H/run-delay * * * *"), and a random
+        per-job delay of up to --jitter seconds; --record-launches waits
+        for a scheduled run of every job and records when they launched
     * To enable or disable "Mesos Single-Use Agent"; this is a toggle
         and applies to all jobs equally. (default: False)
     * How long, in seconds, for a job to "work" (sleep)
         (--work-duration)
     * CPU quota (--cpu-quota); 0.0 to disable / no quota
+    * With a CPU quota, the fraction of it to keep agents under
+        (--quota-target); new masters and job triggers wait while the
+        agent role is over it, and the time they waited is recorded
+    * Before launching, a planner reports how many masters and their
+        agents fit on the cluster under the CPU quota. Launch only that
+        many (--fit-masters), and/or pin each master to the agent the
+        planner chose for it (--pin-masters)
+    * Deploy each batch of masters as one Marathon deployment
+        (--group-deploy) rather than one deployment per master
     * To enable or disable External Volumes (--external-volume);
         this uses rexray (default: False)
-    * What test scenario to run (--scenario); supported values:
+    * What test scenarios to run (--scenario); a single scenario name
+        or a weighted mix such as "sleep:3,cpu:1,pipeline:1". Scenarios
+        are defined in scenarios.py:
         - sleep (sleep for --work-duration)
         - buildmarathon (build the open source marathon project)
+        - cpu (keep the executor's CPUs busy for --work-duration)
+        - io (write and read back files for --work-duration)
+        - docker-build (build a small docker image)
+        - pipeline (a Pipeline with three parallel branches that sleep)
+        - artifact (archive 100 MB of artifacts)
+    * Idle agents to keep for the warm label when comparing queue
+        times (--warm-pool)
+    * Build arrival model (--arrival-model; poisson, burst or
+        diurnal), rate in builds/minute across all masters
+        (--arrival-rate) and how long, in seconds, to generate load
+        (--load-duration) for the throughput test
 """
 
+import collections
 import logging
 import time
 from threading import Thread, Lock
 from typing import List, Set
-from xml.etree import ElementTree
 
+import admission
 import config
 import jenkins
+import jenkins_fanout
+import jenkins_remote_access
+import load_generator
+import planner
 import pytest
+import scenarios
 import sdk_dcos
 import sdk_marathon
 import sdk_quota
@@ -56,6 +93,14 @@ DOCKER_IMAGE="benclarkwood/dind:3"
 DEPLOY_TIMEOUT = 15 * 60  # 15 mins
 JOB_RUN_TIMEOUT = 10 * 60  # 10 mins
 SERVICE_ACCOUNT_TIMEOUT = 15 * 60 # 5 mins
+# time allowed on top of a scenario's expected build duration for its
+# agents to provision before its results are collected
+SCENARIO_MARGIN_SECONDS = 5 * 60
+# time given to a warm agent pool to provision before builds start
+WARM_POOL_FILL_SECONDS = 3 * 60
+# executor of the labels made by _create_executor_configuration()
+EXECUTOR_CPUS = 0.3
+EXECUTOR_MEM = 1800
 
 LOCK = Lock()
 
@@ -113,7 +158,14 @@ def test_scaling_load(master_count,
                       scenario,
                       min_index,
                       max_index,
-                      batch_size) -> None:
+                      batch_size,
+                      cron_style,
+                      jitter,
+                      pin_masters: bool,
+                      fit_masters: bool,
+                      quota_target,
+                      group_deploy: bool,
+                      record_launches: bool) -> None:
 
     """Launch a load test scenario. This does not verify the results
     of the test, but does ensure the instances and jobs were created.
@@ -134,11 +186,26 @@ def test_scaling_load(master_count,
         min_index: minimum index to begin jenkins suffixes at
         max_index: maximum index to end jenkins suffixes at
         batch_size: batch size to deploy jenkins instances in
+        cron_style: Schedule jobs at the same minute (fixed) or spread
+            them by job name (hashed)
+        jitter: Random quiet period, in seconds, added to each job
+        pin_masters: Pin each master to the agent the planner chose
+        fit_masters: Only launch as many masters as the planner
+            found room for
+        quota_target: Fraction of the CPU quota to keep agents under
+        group_deploy: Deploy each batch as one Marathon deployment
+        record_launches: Wait for a scheduled run of every job and
+            record when they launched
     """
+    # fail fast on an unknown scenario
+    mix = scenarios.parse_mix(scenario)
     security_mode = sdk_dcos.get_security_mode()
     if mom and cpu_quota != 0.0:
         with shakedown.marathon_on_marathon(mom):
             _setup_quota(SHARED_ROLE, cpu_quota)
+    controller = None
+    if cpu_quota != 0.0:
+        controller = admission.AdmissionController(SHARED_ROLE, target=quota_target)
 
     # create marathon client
     if mom:
@@ -156,6 +223,23 @@ def test_scaling_load(master_count,
         #NOTE: using min/max will override master count
         masters = ["jenkins{}".format(index) for index in
                     range(min_index, max_index)]
+
+    # Check the masters and their agents fit now, rather than finding out
+    # from deployments stalled until DEPLOY_TIMEOUT. Every job may have
+    # its own agent at once, sized for the largest scenario in the mix.
+    agent_cpus, agent_mem = max(s.agent_resources() for s, _ in mix)
+    plan = planner.plan_masters(len(masters),
+                                planner.master_resources(config.PACKAGE_NAME),
+                                planner.Resources(agent_cpus, agent_mem, 0.0),
+                                job_count,
+                                planner.get_free_resources(SHARED_ROLE),
+                                cpu_quota)
+    planner.log_plan(plan)
+    TIMINGS["plan"] = plan._asdict()
+    if fit_masters and plan.feasible < len(masters):
+        log.warning("Launching only {} of {} masters.".format(plan.feasible, len(masters)))
+        masters = masters[:plan.feasible]
+    pinned_hostnames = dict(zip(masters, plan.hostnames)) if pin_masters else None
     # create service accounts in parallel
     sdk_security.install_enterprise_cli()
     service_account_threads = _spawn_threads(masters,
@@ -165,35 +249,208 @@ def test_scaling_load(master_count,
     thread_failures = _wait_and_get_failures(service_account_threads,
                                              timeout=SERVICE_ACCOUNT_TIMEOUT)
     # launch Jenkins services
+    launched_masters = []
     current = 0
-    end = max_index - min_index
-    while current + batch_size <= end:
+    end = len(masters)
+    while current < end:
         batched_masters = masters[current:current+batch_size]
-        install_threads = _spawn_threads(batched_masters,
-                                         _install_jenkins,
-                                         event='deployments',
-                                         client=marathon_client,
-                                         external_volume=external_volume,
-                                         security=security_mode,
-                                         daemon=True,
-                                         mom=mom)
-        thread_failures = _wait_and_get_failures(install_threads,
-                                                 timeout=DEPLOY_TIMEOUT)
-        thread_names = [x.name for x in thread_failures]
+        if controller:
+            # a new master's jobs only add to the role once it is under the target
+            controller.admit()
+        if group_deploy:
+            deployed_masters = _install_jenkins_group(batched_masters,
+                                                      external_volume=external_volume,
+                                                      security=security_mode,
+                                                      pinned_hostnames=pinned_hostnames,
+                                                      mom=mom)
+        else:
+            install_threads = _spawn_threads(batched_masters,
+                                             _install_jenkins,
+                                             event='deployments',
+                                             client=marathon_client,
+                                             external_volume=external_volume,
+                                             security=security_mode,
+                                             pinned_hostnames=pinned_hostnames,
+                                             daemon=True,
+                                             mom=mom)
+            thread_failures = _wait_and_get_failures(install_threads,
+                                                     timeout=DEPLOY_TIMEOUT)
+            thread_names = [x.name for x in thread_failures]
+            deployed_masters = [x for x in batched_masters if x not in thread_names]
 
         # the rest of the commands require a running Jenkins instance
-        deployed_masters = [x for x in batched_masters if x not in thread_names]
         job_threads = _spawn_threads(deployed_masters,
                                      _create_jobs,
                                      jobs=job_count,
                                      single=single_use,
                                      delay=run_delay,
                                      duration=work_duration,
-                                     scenario=scenario)
+                                     scenario=scenario,
+                                     cron_style=cron_style,
+                                     jitter=jitter,
+                                     controller=controller)
         _wait_on_threads(job_threads, JOB_RUN_TIMEOUT)
         r = json.dumps(TIMINGS)
         print(r)
         current = current + batch_size
+        launched_masters.extend(deployed_masters)
+
+    if record_launches:
+        # let every job run on its schedule at least once
+        log.info("Waiting {} minute(s) to record the job launch distribution.".format(run_delay + 1))
+        time.sleep((run_delay + 1) * 60)
+        TIMINGS["launches"] = _get_launch_distribution(launched_masters, run_delay)
+    _wait_for_scenario_builds(launched_masters, mix, work_duration)
+    TIMINGS["scenarios"] = _get_scenario_results(launched_masters, mix, work_duration)
+    if controller:
+        TIMINGS["throttled"] = controller.summary()
+    print(json.dumps(TIMINGS))
+
+
+@pytest.mark.scale
+def test_warm_pool_queue_wait(job_count,
+                              warm_pool,
+                              work_duration,
+                              mom) -> None:
+    """Compare how long builds wait in the queue on a label with a
+    warm agent pool against a label without one. This does not verify
+    the results, but logs the mean queue time for each label.
+
+    Both labels get `job_count` jobs, which are all triggered at once
+    after the warm pool has had time to fill.
+
+    Args:
+        job_count: Number of jobs for each label
+        warm_pool: Idle agents to keep for the warm label
+        work_duration: Time, in seconds, for generated jobs to sleep
+        mom: Marathon on Marathon instance name
+    """
+    if mom:
+        with shakedown.marathon_on_marathon(mom):
+            marathon_client = shakedown.marathon.create_client()
+    else:
+        marathon_client = shakedown.marathon.create_client()
+
+    service_name = "jenkins{}".format(sdk_utils.random_string())
+    pools = {"cold": 0, "warm": warm_pool}
+    job_names = {label: ["{}-job-{}".format(label, i) for i in range(job_count)]
+                 for label in pools}
+    _install_jenkins(service_name, client=marathon_client, mom=mom)
+    try:
+        for label, pool in pools.items():
+            _create_executor_configuration(service_name, label, warm_pool=pool)
+            for job_name in job_names[label]:
+                jenkins.create_job(service_name,
+                                   job_name,
+                                   "sleep {}".format(work_duration),
+                                   schedule_frequency_in_min=59,
+                                   labelString=label)
+
+        log.info("Waiting {}s for the warm pool to fill.".format(WARM_POOL_FILL_SECONDS))
+        time.sleep(WARM_POOL_FILL_SECONDS)
+        for names in job_names.values():
+            for job_name in names:
+                jenkins.build_job(service_name, job_name)
+
+        queue_times = {}
+
+        def _all_builds_finished():
+            for names in job_names.values():
+                for job_name in names:
+                    queue_times[job_name] = jenkins.get_queue_times(service_name, job_name)
+            return all(queue_times.values())
+
+        shakedown.time_wait(_all_builds_finished, JOB_RUN_TIMEOUT, sleep_seconds=20)
+
+        TIMINGS["queuewait"] = {}
+        for label, names in job_names.items():
+            waits = [ms for name in names for ms in queue_times[name].values()]
+            TIMINGS["queuewait"][label] = sum(waits) / len(waits) / 1000
+            log.info("Mean queue time on '{}' (warm pool {}): {:.1f}s"
+                     .format(label, pools[label], TIMINGS["queuewait"][label]))
+        print(json.dumps(TIMINGS))
+    finally:
+        _cleanup_jenkins_install(service_name, mom=mom)
+
+
+@pytest.mark.scale
+def test_build_throughput(master_count,
+                          work_duration,
+                          arrival_model,
+                          arrival_rate,
+                          load_duration,
+                          cpu_quota,
+                          quota_target,
+                          mom) -> None:
+    """Drive masters with an open-loop build load and record the
+    throughput and latencies they sustain. This does not verify the
+    results.
+
+    Each master gets one parameterized job that allows concurrent
+    builds. The load generator then triggers builds of it on random
+    masters at `arrival_rate` builds/minute for `load_duration`
+    seconds and follows each build to completion.
+
+    Args:
+        master_count: Number of Jenkins masters or instances
+        work_duration: Time, in seconds, for each build to sleep
+        arrival_model: Arrival model (poisson, burst, diurnal)
+        arrival_rate: Builds per minute across all masters
+        load_duration: Time, in seconds, to generate load for
+        cpu_quota: CPU quota (0.0 to disable); triggers then wait while
+            the agent role is over `quota_target` of it
+        quota_target: Fraction of the CPU quota to keep agents under
+        mom: Marathon on Marathon instance name
+    """
+    if mom:
+        with shakedown.marathon_on_marathon(mom):
+            marathon_client = shakedown.marathon.create_client()
+            if cpu_quota != 0.0:
+                _setup_quota(SHARED_ROLE, cpu_quota)
+    else:
+        marathon_client = shakedown.marathon.create_client()
+    controller = None
+    if cpu_quota != 0.0:
+        controller = admission.AdmissionController(SHARED_ROLE, target=quota_target)
+
+    masters = ["jenkins{}".format(sdk_utils.random_string()) for _ in range(master_count)]
+    install_threads = _spawn_threads(masters,
+                                     _install_jenkins,
+                                     event='deployments',
+                                     client=marathon_client,
+                                     daemon=True,
+                                     mom=mom)
+    thread_failures = _wait_and_get_failures(install_threads, timeout=DEPLOY_TIMEOUT)
+    failed = [x.name for x in thread_failures]
+    deployed_masters = [x for x in masters if x not in failed]
+    try:
+        job_name = 'load-job'
+        for service_name in deployed_masters:
+            label = _create_executor_configuration(service_name)
+            jenkins.create_job(service_name,
+                               job_name,
+                               "sleep {}".format(work_duration),
+                               schedule_frequency_in_min=None,
+                               labelString=label,
+                               concurrent=True,
+                               parameters=[load_generator.TRIGGER_PARAMETER])
+
+        generator = load_generator.LoadGenerator(deployed_masters,
+                                                 job_name,
+                                                 arrival_rate,
+                                                 load_duration,
+                                                 model=arrival_model,
+                                                 controller=controller,
+                                                 build_cpus=_executor_agent_cpus())
+        TIMINGS["throughput"] = generator.run()
+        if controller:
+            TIMINGS["throttled"] = controller.summary()
+        print(json.dumps(TIMINGS))
+    finally:
+        cleanup_threads = _spawn_threads(masters,
+                                         _cleanup_jenkins_install,
+                                         mom=mom)
+        _wait_and_get_failures(cleanup_threads, timeout=JOB_RUN_TIMEOUT)
 
 
 @pytest.mark.scalecleanup
@@ -301,6 +558,7 @@ def _create_service_accounts(service_name, security=None):
 def _install_jenkins(service_name,
                      client=None,
                      security=None,
+                     pinned_hostnames=None,
                      **kwargs):
     """Install Jenkins service.
 
@@ -308,6 +566,8 @@ def _install_jenkins(service_name,
         service_name: Service Name or Marathon ID (same thing)
         client: Marathon client connection
         external_volume: Enable external volumes
+        pinned_hostnames: Dict of service name to the agent hostname
+            to pin the master to
     """
     def _wait_for_deployment(app_id, client):
         with LOCK:
@@ -321,6 +581,8 @@ def _install_jenkins(service_name,
                 'mesos_principal': ACCOUNTS[service_name]["sa_name"],
             }
             kwargs['service_user'] = 'root'
+        if pinned_hostnames:
+            kwargs['pinned_hostname'] = pinned_hostnames.get(service_name)
 
         log.info("Installing jenkins '{}'".format(service_name))
         jenkins.install(service_name,
@@ -333,6 +595,48 @@ def _install_jenkins(service_name,
         raise e
 
 
+def _install_jenkins_group(service_names,
+                           security=None,
+                           pinned_hostnames=None,
+                           external_volume=None,
+                           mom=None):
+    """Install Jenkins services as one Marathon deployment.
+
+    Args:
+        service_names: Service names or Marathon IDs
+        security: DC/OS security mode
+        pinned_hostnames: Dict of service name to the agent hostname
+            to pin the master to
+        external_volume: Enable external volumes
+        mom: Marathon on Marathon instance name
+
+    Returns: The service names deployed, or [] if the deployment failed.
+    """
+    installs = {}
+    for service_name in service_names:
+        kwargs = {'role': SHARED_ROLE, 'external_volume': external_volume}
+        if security == DCOS_SECURITY.strict:
+            kwargs['strict_settings'] = {
+                'secret_name': ACCOUNTS[service_name]["sa_secret"],
+                'mesos_principal': ACCOUNTS[service_name]["sa_name"],
+            }
+            kwargs['service_user'] = 'root'
+        if pinned_hostnames:
+            kwargs['pinned_hostname'] = pinned_hostnames.get(service_name)
+        installs[service_name] = kwargs
+
+    start = time.time()
+    try:
+        jenkins.install_group(installs, mom=mom, timeout_seconds=DEPLOY_TIMEOUT)
+    except Exception as e:
+        log.warning("Error encountered while installing Jenkins group: {}".format(e))
+        return []
+    end = time.time()
+    for service_name in service_names:
+        TIMINGS["deployments"][service_name] = end - start
+    return list(service_names)
+
+
 def _cleanup_jenkins_install(service_name, **kwargs):
     """Delete all jobs and uninstall Jenkins instance.
 
@@ -351,34 +655,48 @@ def _cleanup_jenkins_install(service_name, **kwargs):
                           **kwargs)
 
 
-def _create_jobs(service_name, **kwargs):
+def _executor_agent_cpus():
+    """CPUs of one agent of a label made by _create_executor_configuration()."""
+    return float(jenkins_remote_access.SLAVE_INFO_DEFAULTS['slaveCpus']) + EXECUTOR_CPUS
+
+
+def _create_jobs(service_name, scenario='sleep', **kwargs):
     """Create jobs on deployed Jenkins instances.
 
     All functionality around creating jobs should go here.
 
     Args:
         service_name: Jenkins instance name
+        scenario: Scenario mix, see scenarios.parse_mix()
     """
-    m_label = _create_executor_configuration(service_name)
-    _launch_jobs(service_name, label=m_label, **kwargs)
+    mix = scenarios.parse_mix(scenario)
+    jenkins_remote_access.apply_slave_infos(service_name,
+                                            [s.slave_info(DOCKER_IMAGE) for s, _ in mix],
+                                            timeout_seconds=600)
+    _launch_jobs(service_name, mix=mix, **kwargs)
 
 
-def _create_executor_configuration(service_name: str) -> str:
-    """Create a new Mesos Slave Info configuration with a random name.
+def _create_executor_configuration(service_name: str,
+                                   mesos_label: str = "mesos",
+                                   warm_pool: int = 0) -> str:
+    """Create a new Mesos Slave Info configuration.
 
     Args:
         service_name: Jenkins instance to add the label
+        mesos_label: Label of the new config
+        warm_pool: Idle agents to keep provisioned for the label
 
-    Returns: Random name of the new config created.
+    Returns: Name of the new config created.
 
     """
-    mesos_label = "mesos"
     jenkins.create_mesos_slave_node(mesos_label,
                                     service_name=service_name,
                                     dockerImage=DOCKER_IMAGE,
-                                    executorCpus=0.3,
-                                    executorMem=1800,
+                                    executorCpus=EXECUTOR_CPUS,
+                                    executorMem=EXECUTOR_MEM,
                                     idleTerminationMinutes=1,
+                                    warmPoolMin=warm_pool,
+                                    warmPoolMax=warm_pool,
                                     timeout_seconds=600)
     return mesos_label
 
@@ -388,41 +706,152 @@ def _launch_jobs(service_name: str,
                  single: bool = False,
                  delay: int = 3,
                  duration: int = 600,
-                 label: str = None,
-                 scenario: str = None):
+                 mix: list = None,
+                 cron_style: str = 'fixed',
+                 jitter: int = 0,
+                 controller: admission.AdmissionController = None):
     """Create configured number of jobs with given config on Jenkins
-    instance identified by `service_name`.
+    instance identified by `service_name`, and queue each one once.
 
     Args:
         service_name: Jenkins service name
         jobs: Number of jobs to create and run
         single: Single Use Mesos agent on (true) or off
         delay: A job should run every X minute(s)
-        duration: Time, in seconds, for the job to sleep
-        label: Mesos label for jobs to use
+        duration: Time, in seconds, for the job to work
+        mix: List of (Scenario, weight) to split the jobs between
+        cron_style: fixed (*/delay) or hashed (H/delay) schedules
+        jitter: Random quiet period, in seconds, added to each job
+        controller: Admission controller to queue each job through, so
+            that its agent stays under the quota target
     """
-    job_name = 'generator-job'
-    single_use_str = '100' if single else '0'
-
-    seed_config_xml = jenkins._get_job_fixture('gen-job.xml')
-    seed_config_str = ElementTree.tostring(
-            seed_config_xml.getroot(),
-            encoding='utf8',
-            method='xml')
-    jenkins.create_seed_job(service_name, job_name, seed_config_str)
+    mix = mix or scenarios.parse_mix('sleep')
+    job_configs = {}
+    job_cpus = {}
+    for index, scenario in enumerate(scenarios.assign(mix, jobs), 1):
+        settings = scenarios.JobSettings(duration, delay, scenario.label, cron_style, jitter, single,
+                                         scenario.whole_cpus)
+        job_name = 'test-job-{}-{}'.format(index, scenario.name)
+        job_configs[job_name] = scenario.job_config(settings)
+        job_cpus[job_name] = scenario.agent_resources()[0]
     log.info(
             "Launching {} jobs every {} minutes with single-use "
             "({}).".format(jobs, delay, single))
 
-    jenkins.run_job(service_name,
-                    job_name,
-                    timeout_seconds=600,
-                    **{'JOBCOUNT':       str(jobs),
-                       'AGENT_LABEL':    label,
-                       'SINGLE_USE':     single_use_str,
-                       'EVERY_XMIN':     str(delay),
-                       'SLEEP_DURATION': str(duration),
-                       'SCENARIO':       scenario})
+    jenkins_remote_access.create_jobs(service_name,
+                                      job_configs,
+                                      queue=controller is None,
+                                      timeout_seconds=600)
+    if controller:
+        for job_name, cpus in job_cpus.items():
+            controller.admit(cpus)
+            jenkins.build_job(service_name, job_name)
+
+
+def _wait_for_scenario_builds(service_names, mix, duration):
+    """Wait until every generated job across all masters has a completed
+    build, or for the longest expected duration of the scenarios in
+    `mix` plus SCENARIO_MARGIN_SECONDS. Jobs still without a completed
+    build after that are logged and counted as failed by
+    _get_scenario_results().
+    """
+    names = {scenario.name for scenario, _ in mix}
+    timeout = max(scenario.expected_duration(duration) for scenario, _ in mix) + SCENARIO_MARGIN_SECONDS
+    deadline = time.time() + timeout
+    tree = 'jobs[name,lastCompletedBuild[number]]'
+    while True:
+        waiting = 0
+        with jenkins_fanout.JenkinsFanout(service_names) as fanout:
+            for result in fanout.get_jobs(tree=tree):
+                for job in result.value or []:
+                    if _scenario_name(job['name'], names) and not job.get('lastCompletedBuild'):
+                        waiting += 1
+        if not waiting:
+            return
+        if time.time() >= deadline:
+            log.warning("{} job(s) have no completed build after {}s.".format(waiting, timeout))
+            return
+        log.info("Waiting on {} job(s) to complete a build.".format(waiting))
+        time.sleep(20)
+
+
+def _scenario_name(job_name, names):
+    """Returns the scenario of a generated job, named
+    test-job-<index>-<scenario>, if it is one of `names`.
+    """
+    parts = job_name.split('-', 3)
+    if job_name.startswith('test-job-') and len(parts) == 4 and parts[3] in names:
+        return parts[3]
+    return None
+
+
+def _get_scenario_results(service_names, mix, duration):
+    """Check the last completed build of every generated job against
+    its scenario, across all masters.
+
+    Returns: dict of scenario name to the number of jobs, how many
+        last builds passed the scenario's success check, and their mean
+        and expected durations in seconds.
+    """
+    names = {scenario.name: scenario for scenario, _ in mix}
+    results = {name: {"jobs": 0, "succeeded": 0, "durations": []} for name in names}
+    tree = 'jobs[name,lastCompletedBuild[result,duration,artifacts[fileName]]]'
+    with jenkins_fanout.JenkinsFanout(service_names) as fanout:
+        for result in fanout.get_jobs(tree=tree):
+            for job in result.value or []:
+                name = _scenario_name(job['name'], names)
+                if name:
+                    build = job.get('lastCompletedBuild')
+                    stats = results[name]
+                    stats["jobs"] += 1
+                    stats["succeeded"] += int(names[name].success(build))
+                    if build:
+                        stats["durations"].append(build['duration'] / 1000)
+
+    for name, stats in results.items():
+        durations = stats.pop("durations")
+        stats["mean_duration"] = sum(durations) / len(durations) if durations else None
+        stats["expected_duration"] = names[name].expected_duration(duration)
+    return results
+
+
+def _get_launch_distribution(service_names, run_delay):
+    """Summarize when scheduled builds of generated jobs became buildable,
+    as the offset in seconds into their `run_delay` minute schedule,
+    across all masters. This includes the --jitter quiet period but not
+    the wait for an agent. Builds not started by the schedule, such as
+    the one queued when a job is created, are left out.
+
+    Returns: dict with the number of builds, how many seconds of the
+        interval saw a launch, the most launches in one second, and a
+        histogram of launches per offset second.
+    """
+    period_ms = run_delay * 60 * 1000
+    histogram = collections.Counter()
+    tree = 'jobs[name,builds[timestamp,actions[buildableDurationMillis,causes[_class]]]]'
+    with jenkins_fanout.JenkinsFanout(service_names) as fanout:
+        for result in fanout.get_jobs(tree=tree):
+            for job in result.value or []:
+                if not job['name'].startswith('test-job-'):
+                    continue
+                for build in job.get('builds', []):
+                    actions = build['actions']
+                    causes = [c.get('_class', '') for a in actions for c in a.get('causes', [])]
+                    if not any('TimerTrigger' in c for c in causes):
+                        continue
+                    # when the build became buildable, after its quiet period
+                    # and before it waited for an agent
+                    buildable = [a['buildableDurationMillis'] for a in actions
+                                 if 'buildableDurationMillis' in a]
+                    launched = build['timestamp'] - (buildable[0] if buildable else 0)
+                    histogram[(launched % period_ms) // 1000] += 1
+
+    return {
+        "builds": sum(histogram.values()),
+        "active_seconds": len(histogram),
+        "busiest_second": max(histogram.values()) if histogram else 0,
+        "per_second": {str(k): v for k, v in sorted(histogram.items())},
+    }
 
 
 def _wait_on_threads(thread_list: List[Thread],
@@ -3,6 +3,7 @@ import uuid
 
 import config
 import jenkins
+import jenkins_fanout
 import jenkins_remote_access
 import pytest
 import retrying
@@ -68,6 +69,17 @@ def test_label_create_job(create_slave):
     wait_until_job_run(config.SERVICE_NAME, test_job_name)
 
 
+@pytest.mark.sanity
+def test_trigger_and_wait_for_build():
+    test_job_name = get_test_job_name()
+    jenkins.create_job(config.SERVICE_NAME, test_job_name, "echo \"test command\";", 59)
+
+    queue_id = jenkins.trigger_build(config.SERVICE_NAME, test_job_name)
+    build = jenkins.wait_for_build(config.SERVICE_NAME, test_job_name, queue_id,
+                                   result='SUCCESS', timeout_seconds=5 * 60)
+    assert build['number'] >= 1
+
+
 @pytest.mark.sanity
 def test_install_custom_name():
     svc_name = 'jenkins-custom'
@@ -90,6 +102,38 @@ def test_get_job_failures():
     r = jenkins_remote_access.get_job_failures(config.SERVICE_NAME)
     assert r.status_code == 200
 
+    failures = list(jenkins_remote_access.iter_job_failures(config.SERVICE_NAME, page_size=1))
+    assert all('errors' in failure for failure in failures)
+
+
+@pytest.mark.sanity
+def test_fanout_get_jobs():
+    test_job_name = get_test_job_name()
+    jenkins.create_job(config.SERVICE_NAME, test_job_name, "echo \"test command\";", 5)
+
+    with jenkins_fanout.JenkinsFanout([config.SERVICE_NAME, 'jenkins-missing']) as fanout:
+        results = {r.service_name: r for r in fanout.get_jobs()}
+
+    assert test_job_name in [job['name'] for job in results[config.SERVICE_NAME].value]
+    assert results['jenkins-missing'].error is not None
+
+
+@pytest.mark.sanity
+def test_apply_slave_infos():
+    labels = [sdk_utils.random_string() for _ in range(3)]
+    upserts = [{'labelString': label, 'executorMem': 1024} for label in labels]
+
+    r = jenkins_remote_access.apply_slave_infos(config.SERVICE_NAME, upserts)
+    assert sorted(r['created']) == sorted(labels)
+
+    upserts[0]['executorMem'] = 2048
+    r = jenkins_remote_access.apply_slave_infos(config.SERVICE_NAME, upserts)
+    assert r['updated'] == labels[:1]
+    assert sorted(r['unchanged']) == sorted(labels[1:])
+
+    r = jenkins_remote_access.apply_slave_infos(config.SERVICE_NAME, deletes=labels)
+    assert sorted(r['deleted']) == sorted(labels)
+
 
 @pytest.mark.sanity
 def test_change_mesos_creds():